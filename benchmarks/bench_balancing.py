@@ -0,0 +1,55 @@
+#Time the team-balancing engine: planning alone, and planning plus the bulk writes against a local mongod.
+#Usage: python benchmarks/bench_balancing.py [--sizes 1000 10000 100000] [--programs 8]
+from __future__ import print_function
+import argparse
+import time
+from bson.objectid import ObjectId
+from common import load_server
+
+server, counter = load_server()
+
+TEAM_PARAM = {"_id": None, "minimumNumberOfStudents": 3, "maximumNumberOfStudents": 5}
+
+def students_for(n, programs):
+    return [{"username": "s%d" % i, "programOfStudy": "P%d" % (i % programs)} for i in range(n)]
+
+def incomplete_teams_for(n):
+    #One incomplete team per 50 students, half of them below the minimum
+    return [{"_id": ObjectId(), "teamSize": 1 + (i % 4)} for i in range(n // 50)]
+
+def seed(team_param, incomplete_teams):
+    server.teams.delete_many({})
+    if incomplete_teams:
+        server.teams.insert_many([
+            {"_id": team['_id'], "teamParamId": team_param['_id'], "teamName": "Existing %d" % i,
+             "status": "incomplete", "teamSize": team['teamSize'],
+             "teamMembers": ["existing%d-%d" % (i, j) for j in range(team['teamSize'])],
+             "liason": "existing%d-0" % i, "requestedMembers": []}
+            for i, team in enumerate(incomplete_teams)])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--programs', type=int, default=8)
+    args = parser.parse_args()
+
+    print("%-9s %12s %12s %12s %12s %10s" % ("students", "plan ms", "apply ms", "round trips", "new teams", "unplaced"))
+    for n in args.sizes:
+        team_param = dict(TEAM_PARAM, _id=ObjectId())
+        students = students_for(n, args.programs)
+        incomplete_teams = incomplete_teams_for(n)
+        seed(team_param, incomplete_teams)
+
+        start = time.time()
+        additions, new_teams, unassigned = server.plan_team_allocation(team_param, incomplete_teams, students)
+        plan_ms = (time.time() - start) * 1000
+
+        counter.reset()
+        start = time.time()
+        server.apply_team_allocation(team_param, incomplete_teams, additions, new_teams)
+        apply_ms = (time.time() - start) * 1000
+
+        placed = sum(len(members) for members in additions.values()) + sum(len(members) for members in new_teams)
+        assert placed + len(unassigned) == n
+        print("%-9d %12.1f %12.1f %12d %12d %10d" % (n, plan_ms, apply_ms, counter.total(), len(new_teams), len(unassigned)))
+    server.client.drop_database(server.db.name)
@@ -0,0 +1,156 @@
+#/events over HTTP: starts gunicorn with a configuration, opens idle event streams from real sockets and checks
+#whether the server still answers GET /teamParams while they are connected. With --deliver it also updates a
+#team of every subscriber and times the 'teamChanged' events, which needs a replica set for the change stream.
+#Compares the gthread server of gunicorn.conf.py with the gevent one of gunicorn.events.conf.py by default.
+#Usage: python benchmarks/bench_event_streams.py [--streams 30 100 1000] [--config gunicorn.events.conf.py] [--deliver]
+from __future__ import print_function
+import argparse
+import os
+import resource
+import select
+import socket
+import subprocess
+import time
+try:
+    from urllib2 import Request, urlopen
+except ImportError:
+    from urllib.request import Request, urlopen
+from common import BENCH_DB, load_server, percentile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PORT = 3102
+BASE = 'http://127.0.0.1:%d' % PORT
+
+server, counter = load_server()
+
+def seed(students):
+    password = server.encrypt("test")
+    student_ids = server.student_users.insert_many([
+        {"username": "s%d" % i, "password": password, "email": "s%d@uottawa.ca" % i,
+         "firstName": "S", "lastName": str(i), "programOfStudy": "SEG"} for i in range(students)
+    ]).inserted_ids
+    server.migrate_user_directory()
+    #Tokens are signed here rather than fetched from /auth, which would spend a bcrypt hash per subscriber
+    with server.app.app_context():
+        tokens = [server.jwt.jwt_encode_callback({"_id": student_id}) for student_id in student_ids]
+    return [token.decode('utf-8') if isinstance(token, bytes) else token for token in tokens]
+
+def wait_for_port(seconds=30):
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', PORT), 1).close()
+            return
+        except socket.error:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start listening on port %d" % PORT)
+
+def start_gunicorn(config, change_stream):
+    env = dict(os.environ, TMS_MONGO_DB=BENCH_DB, TMS_BIND='127.0.0.1:%d' % PORT,
+               TMS_EVENTS_BIND='127.0.0.1:%d' % PORT, TMS_ACCESS_LOG='/dev/null')
+    if change_stream:
+        env['TMS_EVENTS_CHANGE_STREAM'] = '1'
+    process = subprocess.Popen(['gunicorn', '-c', config, 'server:app'], cwd=ROOT, env=env)
+    wait_for_port()
+    return process
+
+#One subscriber: a socket with its GET /events sent. HTTP/1.0 so the stream is not chunked
+class Stream(object):
+    def __init__(self, token):
+        self.sock = socket.create_connection(('127.0.0.1', PORT), 5)
+        self.sock.sendall(('GET /events HTTP/1.0\r\nAuthorization: JWT %s\r\n\r\n' % token).encode('utf-8'))
+        self.sock.setblocking(0)
+        self.buffer = b''
+        self.opened = None
+        self.delivered = None
+
+    #False once the server has closed the stream
+    def read(self):
+        try:
+            chunk = self.sock.recv(65536)
+        except socket.error:
+            return True
+        if not chunk:
+            return False
+        self.buffer = (self.buffer + chunk)[-4096:]
+        now = time.time()
+        if self.opened is None and b'retry:' in self.buffer:
+            self.opened = now
+        if self.delivered is None and b'event: teamChanged' in self.buffer:
+            self.delivered = now
+        return True
+
+#Read the streams until done(streams) is true or seconds have passed
+def poll(streams, done, seconds):
+    poller = select.poll()
+    by_fd = dict((stream.sock.fileno(), stream) for stream in streams)
+    for fd in by_fd:
+        poller.register(fd, select.POLLIN)
+    deadline = time.time() + seconds
+    while not done(streams) and time.time() < deadline:
+        for fd, mask in poller.poll(100):
+            if not by_fd[fd].read():
+                poller.unregister(fd)
+
+#Sequential GET /teamParams while the streams are open, returns (sorted latencies in ms, failed requests)
+def probe_api(token, requests):
+    timings = []
+    failed = 0
+    for i in range(requests):
+        start = time.time()
+        try:
+            urlopen(Request(BASE + '/teamParams', None, {"Authorization": "JWT " + token}), timeout=5).read()
+            timings.append((time.time() - start) * 1000)
+        except Exception:
+            failed += 1
+    timings.sort()
+    return timings, failed
+
+def run(config, tokens, streams_count, deliver):
+    process = start_gunicorn(config, deliver)
+    streams = []
+    try:
+        start = time.time()
+        streams = [Stream(token) for token in tokens[:streams_count]]
+        poll(streams, lambda streams: all(stream.opened for stream in streams), 10)
+        opened = [stream.opened - start for stream in streams if stream.opened]
+        #The probe uses a token of its own, it is not one of the subscribers
+        timings, failed = probe_api(tokens[-1], 10)
+        delivered = []
+        if deliver:
+            sent = time.time()
+            server.teams.update_one({"teamName": "bench"}, {"$set": {"sent": sent}})
+            poll(streams, lambda streams: all(stream.delivered for stream in streams if stream.opened), 10)
+            delivered = sorted((stream.delivered - sent) * 1000 for stream in streams if stream.delivered)
+        return len(opened), max(opened) if opened else 0.0, timings, failed, delivered
+    finally:
+        for stream in streams:
+            stream.sock.close()
+        process.terminate()
+        process.wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--streams', type=int, nargs='+', default=[30, 100, 1000])
+    parser.add_argument('--config', nargs='+', default=['gunicorn.conf.py', 'gunicorn.events.conf.py'])
+    parser.add_argument('--deliver', action='store_true', help="time teamChanged events, needs a replica set")
+    args = parser.parse_args()
+
+    #Every stream is a socket of this process
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    tokens = seed(max(args.streams) + 1)
+    if args.deliver:
+        server.teams.insert_one({"teamName": "bench", "liason": "s0", "teamSize": max(args.streams),
+                                 "teamMembers": ["s%d" % i for i in range(max(args.streams))]})
+
+    print("%-24s %8s %8s %10s %12s %12s %12s %12s" % (
+        "config", "streams", "opened", "open s", "API p50 ms", "API failed", "event p50 ms", "event p99 ms"))
+    for config in args.config:
+        for n in args.streams:
+            opened, open_seconds, timings, failed, delivered = run(config, tokens, n, args.deliver)
+            print("%-24s %8d %8d %10.2f %12.2f %12d %12.2f %12.2f" % (
+                config, n, opened, open_seconds, percentile(timings, 50), failed,
+                percentile(delivered, 50), percentile(delivered, 99)))
+    server.client.drop_database(server.db.name)
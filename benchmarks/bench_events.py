@@ -0,0 +1,58 @@
+#Fan-out of the /events broker with thousands of idle subscribers, each a thread blocked on its queue the way
+#an open event stream is. Reports subscribe cost, publish & delivery latency and the process's memory.
+#Only the in-process broker is timed, bench_event_streams.py holds the streams open over HTTP against gunicorn.
+#Usage: python benchmarks/bench_events.py [--subscribers 1000 5000]
+from __future__ import print_function
+import argparse
+import resource
+import threading
+import time
+from common import load_server, percentile
+
+server, counter = load_server()
+
+def run(subscribers):
+    broker = server.EventBroker(server.app.config['EVENTS_QUEUE_SIZE'])
+    delivered = []
+    lock = threading.Lock()
+    ready = threading.Semaphore(0)
+
+    def subscriber(username):
+        queue = broker.subscribe(username)
+        ready.release()
+        event = queue.get()
+        with lock:
+            delivered.append(time.time() - event['sent'])
+        broker.unsubscribe(username, queue)
+
+    start = time.time()
+    threads = [threading.Thread(target=subscriber, args=("s%d" % i,)) for i in range(subscribers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for i in range(subscribers):
+        ready.acquire()
+    subscribe_seconds = time.time() - start
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+    start = time.time()
+    for i in range(subscribers):
+        broker.publish("s%d" % i, {"type": "joinRequest", "sent": time.time()})
+    publish_seconds = time.time() - start
+    for thread in threads:
+        thread.join()
+    delivered.sort()
+    return subscribe_seconds, publish_seconds, delivered, rss_mb
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--subscribers', type=int, nargs='+', default=[1000, 2000, 5000])
+    args = parser.parse_args()
+
+    print("%-12s %14s %14s %12s %12s %10s" % ("subscribers", "subscribe ms", "publish ms", "p50 ms", "p99 ms", "max RSS MB"))
+    for n in args.subscribers:
+        subscribe_seconds, publish_seconds, delivered, rss_mb = run(n)
+        print("%-12d %14.1f %14.1f %12.2f %12.2f %10.1f" % (
+            n, subscribe_seconds * 1000, publish_seconds * 1000,
+            percentile(delivered, 50) * 1000, percentile(delivered, 99) * 1000, rss_mb))
+    server.client.drop_database(server.db.name)
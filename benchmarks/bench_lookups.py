@@ -0,0 +1,103 @@
+#Compares running the independent queries of /createTeam & /acceptMembers in turn (LOOKUP_WORKERS = 0)
+#with running them concurrently through gather(), from a number of concurrent clients.
+#Each student creates a team of their own, then the liaison of a large team accepts students one per request.
+#Usage: python benchmarks/bench_lookups.py [--students 500] [--clients 1 8 32]
+from __future__ import print_function
+import argparse
+import json
+import threading
+import time
+from common import load_server, percentile
+
+server, counter = load_server()
+client = server.app.test_client()
+
+def seed(students):
+    password = server.encrypt("test") # hashed once, shared by every seeded user
+    instructor_id = server.instructor_users.insert_one(
+        {"username": "itest", "password": password, "email": "i@uottawa.ca", "firstName": "I", "lastName": "Test"}).inserted_id
+    server.student_users.insert_many([
+        {"username": "s%d" % i, "password": password, "email": "s%d@uottawa.ca" % i,
+         "firstName": "S", "lastName": str(i), "programOfStudy": "SEG"} for i in range(students + 1)
+    ])
+    server.migrate_user_directory()
+    course_id = server.courses.insert_one({"courseCode": "SEG3102", "courseSection": "A"}).inserted_id
+    return server.team_params.insert_one({
+        "instructorId": instructor_id, "courseId": course_id,
+        "minimumNumberOfStudents": 1, "maximumNumberOfStudents": students + 1,
+        "deadline": server.parse_date("20/05/2030 23:59:00")
+    }).inserted_id
+
+def reset():
+    server.teams.delete_many({})
+    server.memberships.delete_many({})
+
+def token(username):
+    resp = client.post('/auth', data=json.dumps({"username": username, "password": "test"}), content_type='application/json')
+    return json.loads(resp.data)['access_token']
+
+def post(token, path, body):
+    return client.post(path, data=json.dumps(body), content_type='application/json',
+                       headers={"Authorization": "JWT " + token})
+
+#Run the jobs from `clients` threads, returns (wall seconds, sorted latencies in ms, failures)
+def run(jobs, clients):
+    lock = threading.Lock()
+    timings = []
+    failures = [0]
+    def worker():
+        while True:
+            with lock:
+                if not jobs:
+                    return
+                job = jobs.pop()
+            start = time.time()
+            status = job().status_code
+            elapsed = (time.time() - start) * 1000
+            with lock:
+                timings.append(elapsed)
+                if status != 200:
+                    failures[0] += 1
+    start = time.time()
+    workers = [threading.Thread(target=worker) for i in range(clients)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    timings.sort()
+    return time.time() - start, timings, failures[0]
+
+def report(route, workers, clients, result, requests):
+    seconds, timings, failures = result
+    print("%-14s %-8d %-8d %10.2f %10.2f %10.1f %8.1f %6d" % (
+        route, workers, clients, percentile(timings, 50), percentile(timings, 95),
+        requests / seconds, float(counter.total()) / requests, failures))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32])
+    args = parser.parse_args()
+
+    team_param_id = str(seed(args.students))
+    usernames = ["s%d" % i for i in range(1, args.students + 1)]
+    tokens = dict((username, token(username)) for username in usernames + ["s0"])
+
+    print("%-14s %-8s %-8s %10s %10s %10s %8s %6s" % ("route", "workers", "clients", "p50 ms", "p95 ms", "req/s", "trips", "fails"))
+    for clients in args.clients:
+        for workers in (0, 16):
+            server.app.config['LOOKUP_WORKERS'] = workers
+            reset()
+            counter.reset()
+            result = run([lambda u=u: post(tokens[u], '/createTeam', {
+                "team_param_id": team_param_id, "team_name": "Team " + u, "team_members": [u]}) for u in usernames], clients)
+            report('/createTeam', workers, clients, result, len(usernames))
+
+            reset()
+            post(tokens["s0"], '/createTeam', {"team_param_id": team_param_id, "team_name": "Big Team", "team_members": ["s0"]})
+            team_id = str(server.teams.find_one({"teamName": "Big Team"})['_id'])
+            counter.reset()
+            result = run([lambda u=u: post(tokens["s0"], '/acceptMembers', {
+                "team_id": team_id, "list_of_usernames": [u]}) for u in usernames], clients)
+            report('/acceptMembers', workers, clients, result, len(usernames))
+    server.client.drop_database(server.db.name)
@@ -0,0 +1,285 @@
+#End-to-end benchmark of every route against a local mongod. Seeds a synthetic dataset (dummyData.generate),
+#then drives each route in turn from concurrent clients and reports p50/p95/p99 latency, throughput, the
+#share of failed requests and the Mongo round trips per request. Results are written as JSON; given a
+#baseline from an earlier run, routes that got slower or make more round trips are flagged and the script
+#exits with status 1.
+#Usage: python benchmarks/bench_routes.py [--scale small|medium|large] [--clients 16] [--requests 200]
+#           [--routes /teams /students] [--output results.json] [--baseline baseline.json] [--tolerance 0.2]
+#           [--url http://host:port]
+#Requests go through the app in-process (the whole WSGI stack, without sockets) unless --url points at a
+#server running with TMS_MONGO_DB set to the benchmark database, in which case round trips are not counted.
+#/events is left out, its requests never end.
+from __future__ import print_function
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+try:
+    from urllib2 import Request, urlopen, HTTPError
+except ImportError:
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+
+SCALES = {
+    "small": dict(students=1000, instructors=10, team_params=20, teams=200),
+    "medium": dict(students=10000, instructors=50, team_params=50, teams=2000),
+    "large": dict(students=100000, instructors=200, team_params=100, teams=20000)
+}
+
+ROUTES = ['/auth', '/register', '/protected', '/createTeamParams', '/teamParams', '/students', '/teams',
+          '/createTeam', '/importTeams', '/balanceTeams', '/joinTeams', '/viewRequestedMembers', '/acceptMembers',
+          '/teamsInTeamParam', '/liasionTeams']
+
+DEADLINE = "20/05/2031 23:59:00"
+
+#Sends requests through the Flask test client, or over HTTP to base_url. Returns the status code
+class Client(object):
+    def __init__(self, app, base_url=None):
+        self.app = app
+        self.base_url = base_url
+        self.local = threading.local()
+
+    def send(self, method, path, body=None, token=None):
+        headers = {}
+        if token:
+            headers["Authorization"] = "JWT " + token
+        data = json.dumps(body) if body is not None else None
+        if self.base_url is None:
+            #One test client per thread
+            client = getattr(self.local, 'client', None)
+            if client is None:
+                client = self.local.client = self.app.test_client()
+            return client.open(path, method=method, data=data, headers=headers, content_type='application/json').status_code
+        headers["Content-Type"] = "application/json"
+        req = Request(self.base_url + path, data.encode('utf-8') if data is not None else None, headers)
+        req.get_method = lambda: method
+        try:
+            return urlopen(req).getcode()
+        except HTTPError as e:
+            return e.code
+
+#Everything the jobs need: tokens, ids & a few team parameters of their own, so write routes never collide
+class Context(object):
+    def __init__(self, server, scale, requests):
+        self.server = server
+        self.students = ["student%d" % i for i in range(scale['students'])]
+        if len(self.students) < 2 * requests:
+            raise ValueError("The %d students of this scale are too few for %d requests per route" % (len(self.students), requests))
+        self.user_ids = dict((user['username'], user['_id']) for user in server.users.find({}, {"username": 1}))
+        self.tokens = {}
+        instructor = server.instructor_users.find_one({"username": "instructor0"})
+        self.instructor = instructor['username']
+        self.courses = list(server.courses.find().sort("_id", 1).limit(requests))
+        self.generated_params = [str(team_param['_id']) for team_param in server.team_params.find({}, {"_id": 1}).sort("_id", 1)]
+        self.liaisons = server.teams.distinct("liason")[:requests]
+        self.params = {}
+        for name in ('create', 'join', 'accept', 'import', 'balance'):
+            self.params[name] = server.team_params.insert_one({
+                "instructorId": instructor['_id'],
+                "courseId": self.courses[0]['_id'],
+                "minimumNumberOfStudents": 1,
+                "maximumNumberOfStudents": 4,
+                "deadline": server.parse_date(DEADLINE)
+            }).inserted_id
+        #Teams the join & accept jobs work on, one per liaison
+        self.join_teams = self.insert_teams('join', self.students[:max(1, requests // 10)])
+        self.accept_teams = self.insert_teams('accept', self.students[:requests])
+        #Signed up front, so signing is not part of the timings
+        for username in self.students[:2 * requests] + self.liaisons + [self.instructor]:
+            self.token(username)
+
+    def insert_teams(self, param, liaisons):
+        server = self.server
+        team_param = server.team_params.find_one({"_id": self.params[param]})
+        documents = [server.new_team(team_param, "Bench %s %s" % (param, liaison), [liaison], liaison) for liaison in liaisons]
+        ids = server.teams.insert_many(documents).inserted_ids
+        server.add_memberships([(team_param['_id'], team_id, [liaison]) for team_id, liaison in zip(ids, liaisons)])
+        return [str(team_id) for team_id in ids]
+
+    #Signed like the tokens /auth hands out, without paying for a bcrypt check per simulated user
+    def token(self, username):
+        if username not in self.tokens:
+            with self.server.app.app_context():
+                self.tokens[username] = self.server.jwt.jwt_encode_callback({"_id": self.user_ids[username]}).decode('utf-8')
+        return self.tokens[username]
+
+#The requests sent to a route, as a list of functions taking the client
+def route_jobs(route, ctx, n, run_id):
+    students = ctx.students
+    if route == '/auth':
+        return [lambda c, i=i: c.send('POST', '/auth', {"username": students[i], "password": "test"}) for i in range(n)]
+    if route == '/register':
+        return [lambda c, i=i: c.send('POST', '/register', {
+            "username": "bench%s_%d" % (run_id, i), "password": "test", "email": "bench%d@uottawa.ca" % i,
+            "first_name": "Bench", "last_name": str(i), "user_type": "student", "programOfStudy": "SEG"}) for i in range(n)]
+    if route == '/protected':
+        return [lambda c, t=ctx.token(students[i]): c.send('POST', '/protected', token=t) for i in range(n)]
+    if route == '/createTeamParams':
+        token = ctx.token(ctx.instructor)
+        return [lambda c, course=ctx.courses[i % len(ctx.courses)]: c.send('POST', '/createTeamParams', {
+            "course_code": course['courseCode'], "course_section": course['courseSection'],
+            "minimum_num_students": 2, "maximum_num_students": 4, "deadline": DEADLINE}, token) for i in range(n)]
+    if route == '/teamParams':
+        return [lambda c, t=ctx.token(students[i]): c.send('GET', '/teamParams', token=t) for i in range(n)]
+    if route == '/students':
+        return [lambda c, t=ctx.token(students[i]): c.send('GET', '/students?limit=50', token=t) for i in range(n)]
+    if route == '/teams':
+        return [lambda c, t=ctx.token(students[i]): c.send('GET', '/teams?limit=50', token=t) for i in range(n)]
+    if route == '/createTeam':
+        param = str(ctx.params['create'])
+        return [lambda c, i=i: c.send('POST', '/createTeam', {
+            "team_param_id": param, "team_name": "Bench created %d" % i, "team_members": [students[i]]},
+            ctx.token(students[i])) for i in range(n)]
+    if route == '/importTeams':
+        param = str(ctx.params['import'])
+        token = ctx.token(ctx.instructor)
+        return [lambda c, i=i: c.send('POST', '/importTeams', {"team_param_id": param, "teams": [
+            {"team_name": "Bench imported %d" % i, "team_members": [students[2 * i], students[2 * i + 1]]}]}, token) for i in range(n)]
+    if route == '/balanceTeams':
+        param = str(ctx.params['balance'])
+        token = ctx.token(ctx.instructor)
+        return [lambda c, i=i: c.send('POST', '/balanceTeams', {
+            "team_param_id": param, "usernames": [students[(4 * i + j) % len(students)] for j in range(20)]}, token) for i in range(n)]
+    if route == '/joinTeams':
+        teams = ctx.join_teams
+        return [lambda c, i=i: c.send('POST', '/joinTeams', {"team_ids": [teams[i % len(teams)]]},
+                                      ctx.token(students[len(teams) + i])) for i in range(n)]
+    if route == '/viewRequestedMembers':
+        teams = ctx.join_teams
+        return [lambda c, i=i: c.send('GET', '/viewRequestedMembers?team_id=' + teams[i % len(teams)],
+                                      token=ctx.token(students[i % len(teams)])) for i in range(n)]
+    if route == '/acceptMembers':
+        teams = ctx.accept_teams
+        return [lambda c, i=i: c.send('POST', '/acceptMembers', {"team_id": teams[i], "list_of_usernames": [students[n + i]]},
+                                      ctx.token(students[i])) for i in range(n)]
+    if route == '/teamsInTeamParam':
+        params = ctx.generated_params
+        return [lambda c, i=i: c.send('GET', '/teamsInTeamParam?teamParam_id=' + params[i % len(params)],
+                                      token=ctx.token(students[i])) for i in range(n)]
+    if route == '/liasionTeams':
+        liaisons = ctx.liaisons
+        return [lambda c, i=i: c.send('GET', '/liasionTeams', token=ctx.token(liaisons[i % len(liaisons)])) for i in range(n)]
+    raise ValueError("Unknown route " + route)
+
+#Run the jobs from `clients` threads. Returns (wall seconds, sorted latencies in ms, failed requests)
+def run(jobs, client, clients):
+    lock = threading.Lock()
+    timings = []
+    failures = [0]
+    jobs = list(reversed(jobs))
+    def worker():
+        while True:
+            with lock:
+                if not jobs:
+                    return
+                job = jobs.pop()
+            start = time.time()
+            status = job(client)
+            elapsed = (time.time() - start) * 1000
+            with lock:
+                timings.append(elapsed)
+                if status >= 400:
+                    failures[0] += 1
+    start = time.time()
+    workers = [threading.Thread(target=worker) for i in range(clients)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    timings.sort()
+    return time.time() - start, timings, failures[0]
+
+#Routes of results that regressed against baseline: slower p95, lower throughput or more round trips
+def compare(results, baseline, tolerance):
+    regressions = []
+    for route, current in sorted(results['routes'].items()):
+        before = baseline.get('routes', {}).get(route)
+        if before is None:
+            continue
+        if current['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append("%s: p95 %.2f ms, was %.2f ms" % (route, current['p95_ms'], before['p95_ms']))
+        if current['throughput'] < before['throughput'] * (1 - tolerance):
+            regressions.append("%s: %.1f req/s, was %.1f req/s" % (route, current['throughput'], before['throughput']))
+        if current['round_trips'] is not None and before.get('round_trips') is not None \
+                and current['round_trips'] > before['round_trips'] + 0.5:
+            regressions.append("%s: %.1f round trips per request, was %.1f" % (route, current['round_trips'], before['round_trips']))
+        if current['error_rate'] > before['error_rate'] + 0.01:
+            regressions.append("%s: %.1f%% failed, was %.1f%%" % (route, current['error_rate'] * 100, before['error_rate'] * 100))
+    return regressions
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200, help="requests sent to each route")
+    parser.add_argument('--routes', nargs='+', default=ROUTES, choices=ROUTES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--bcrypt-rounds', type=int, help="cost factor for /register & /auth, defaults to the server's")
+    parser.add_argument('--url', help="benchmark a running server on the benchmark database instead")
+    parser.add_argument('--output', default='bench_routes.json')
+    parser.add_argument('--baseline', help="results of an earlier run to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="slow-down tolerated before a route is flagged")
+    args = parser.parse_args()
+
+    if args.bcrypt_rounds:
+        os.environ['TMS_BCRYPT_ROUNDS'] = str(args.bcrypt_rounds)
+    from common import load_server, percentile
+    server, counter = load_server()
+    import dummyData
+    print("Seeding the %s dataset..." % args.scale)
+    dummyData.generate(seed=args.seed, drop=True, **SCALES[args.scale])
+    ctx = Context(server, SCALES[args.scale], args.requests)
+    client = Client(server.app, args.url)
+    run_id = str(int(time.time()))
+
+    results = {
+        "time": datetime.now().strftime(server.DATE_FORMAT),
+        "revision": git_revision(),
+        "scale": args.scale,
+        "clients": args.clients,
+        "requests": args.requests,
+        "routes": {}
+    }
+    print("%-22s %9s %9s %9s %9s %8s %7s" % ("route", "p50 ms", "p95 ms", "p99 ms", "req/s", "trips", "failed"))
+    #Keep the order of ROUTES, later routes build on what earlier ones wrote (e.g. requests to view)
+    for route in [route for route in ROUTES if route in args.routes]:
+        jobs = route_jobs(route, ctx, args.requests, run_id)
+        counter.reset()
+        seconds, timings, failures = run(jobs, client, args.clients)
+        trips = float(counter.total()) / len(jobs) if args.url is None else None
+        results['routes'][route] = {
+            "p50_ms": percentile(timings, 50),
+            "p95_ms": percentile(timings, 95),
+            "p99_ms": percentile(timings, 99),
+            "throughput": len(jobs) / seconds,
+            "round_trips": trips,
+            "error_rate": float(failures) / len(jobs)
+        }
+        print("%-22s %9.2f %9.2f %9.2f %9.1f %8s %6.1f%%" % (
+            route, percentile(timings, 50), percentile(timings, 95), percentile(timings, 99), len(jobs) / seconds,
+            "-" if trips is None else "%.1f" % trips, 100.0 * failures / len(jobs)))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print("Results written to " + args.output)
+    server.client.drop_database(server.db.name)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against " + args.baseline)
@@ -0,0 +1,73 @@
+#Compare the old per-row lookups of GET /teamParams with the aggregation used by open_team_params_for.
+#Usage: python benchmarks/bench_team_params.py [--sizes 10 100 1000]
+from __future__ import print_function
+import argparse
+from datetime import datetime
+from common import load_server, measure
+
+server, counter = load_server()
+
+def seed(n):
+    db = server.db
+    for name in (server.courses.name, server.instructor_users.name, server.team_params.name, server.teams.name,
+                 server.memberships.name):
+        db[name].delete_many({})
+    instructor_ids = server.instructor_users.insert_many([
+        {"username": "itest%d" % i, "firstName": "Instructor", "lastName": str(i)} for i in range(max(1, n // 10))
+    ]).inserted_ids
+    course_ids = server.courses.insert_many([
+        {"courseCode": "SEG%04d" % i, "courseSection": "A"} for i in range(n)
+    ]).inserted_ids
+    param_ids = server.team_params.insert_many([
+        {
+            "instructorId": instructor_ids[i % len(instructor_ids)],
+            "courseId": course_ids[i],
+            "minimumNumberOfStudents": 2,
+            "maximumNumberOfStudents": 4,
+            "deadline": datetime(2030, 5, 20, 23, 59) # open, past deadlines are filtered out
+        } for i in range(n)
+    ]).inserted_ids
+    #The benchmarked student is on a team in every other team parameter
+    server.teams.insert_many([
+        {
+            "teamParamId": param_ids[i],
+            "teamName": "Team %d" % i,
+            "teamMembers": ["stest", "other%d" % i] if i % 2 == 0 else ["other%d" % i],
+            "requestedMembers": [],
+            "status": "incomplete",
+            "teamSize": 2,
+            "liason": "other%d" % i
+        } for i in range(n)
+    ])
+    server.rebuild_memberships()
+
+def legacy(username):
+    result = []
+    for row in server.team_params.find():
+        member_of_team = False
+        course = server.courses.find_one({'_id': row['courseId']})
+        instructor = server.instructor_users.find_one({'_id': row['instructorId']})
+        for team in server.teams.find({"teamParamId": row['_id']}):
+            if username in team['teamMembers']:
+                member_of_team = True
+        if not member_of_team:
+            result.append((row, course, instructor))
+    return result
+
+def aggregated(username):
+    return list(server.open_team_params_for(username))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    print("%-8s %-12s %12s %10s %10s" % ("params", "mode", "round trips", "mean ms", "p95 ms"))
+    for n in args.sizes:
+        seed(n)
+        assert len(legacy("stest")) == len(aggregated("stest"))
+        for mode, fn in (("legacy", legacy), ("aggregate", aggregated)):
+            trips, mean, p95 = measure(lambda: fn("stest"), counter, args.repeat)
+            print("%-8d %-12s %12.1f %10.2f %10.2f" % (n, mode, trips, mean, p95))
+    server.client.drop_database(server.db.name)
@@ -0,0 +1,117 @@
+#Load profile of the production server: throughput of gunicorn.conf.py as the number of worker processes grows.
+#Starts gunicorn against the benchmark database once per worker count and drives GET /teamParams
+#and GET /teams from concurrent HTTP clients for a fixed duration.
+#Usage: python benchmarks/bench_workers.py [--workers 1 2 4 8] [--clients 64] [--seconds 20]
+from __future__ import print_function
+import argparse
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+try:
+    from urllib2 import Request, urlopen
+except ImportError:
+    from urllib.request import Request, urlopen
+import multiprocessing
+from common import BENCH_DB, load_server, percentile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PORT = 3101
+BASE = 'http://127.0.0.1:%d' % PORT
+
+server, counter = load_server()
+
+def seed(students, team_params):
+    password = server.encrypt("test") # hashed once, shared by every seeded user
+    instructor_id = server.instructor_users.insert_one(
+        {"username": "itest", "password": password, "email": "i@uottawa.ca", "firstName": "I", "lastName": "Test"}).inserted_id
+    server.student_users.insert_many([
+        {"username": "s%d" % i, "password": password, "email": "s%d@uottawa.ca" % i,
+         "firstName": "S", "lastName": str(i), "programOfStudy": "SEG"} for i in range(students)
+    ])
+    server.migrate_user_directory()
+    course_ids = server.courses.insert_many([
+        {"courseCode": "SEG%d" % (3000 + i), "courseSection": "A"} for i in range(team_params)]).inserted_ids
+    server.team_params.insert_many([{
+        "instructorId": instructor_id, "courseId": course_id,
+        "minimumNumberOfStudents": 2, "maximumNumberOfStudents": 5,
+        "deadline": server.parse_date("20/05/2030 23:59:00")
+    } for course_id in course_ids])
+
+def request(path, body=None, token=None):
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = "JWT " + token
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    return urlopen(Request(BASE + path, data, headers)).read()
+
+def wait_for_port(seconds=30):
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', PORT), 1).close()
+            return
+        except socket.error:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start listening on port %d" % PORT)
+
+def start_gunicorn(workers):
+    env = dict(os.environ, TMS_MONGO_DB=BENCH_DB, TMS_WORKERS=str(workers),
+               TMS_BIND='127.0.0.1:%d' % PORT, TMS_ACCESS_LOG='/dev/null')
+    process = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', 'server:app'], cwd=ROOT, env=env)
+    wait_for_port()
+    return process
+
+#Drive the paths round robin from `clients` threads for `seconds`, returns (requests, sorted latencies in ms)
+def drive(paths, token, clients, seconds):
+    lock = threading.Lock()
+    timings = []
+    stop = time.time() + seconds
+    def worker(offset):
+        local = []
+        i = offset
+        while time.time() < stop:
+            start = time.time()
+            request(paths[i % len(paths)], token=token)
+            local.append((time.time() - start) * 1000)
+            i += 1
+        with lock:
+            timings.extend(local)
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    timings.sort()
+    return len(timings), timings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    cores = multiprocessing.cpu_count()
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted(set([1, 2, 4, cores, cores * 2 + 1])))
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--seconds', type=int, default=20)
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--team-params', type=int, default=20)
+    args = parser.parse_args()
+
+    seed(args.students, args.team_params)
+    print("%d cores, %d clients, %d s per run" % (cores, args.clients, args.seconds))
+    print("%-8s %10s %10s %10s %10s" % ("workers", "req/s", "p50 ms", "p99 ms", "scaling"))
+    single = None
+    for workers in args.workers:
+        process = start_gunicorn(workers)
+        try:
+            token = json.loads(request('/auth', {"username": "s0", "password": "test"}).decode('utf-8'))['access_token']
+            drive(['/teamParams'], token, 4, 2) # warm up every worker
+            count, timings = drive(['/teamParams', '/teams?limit=50'], token, args.clients, args.seconds)
+        finally:
+            process.terminate()
+            process.wait()
+        throughput = float(count) / args.seconds
+        single = single or throughput
+        print("%-8d %10.1f %10.2f %10.2f %9.2fx" % (
+            workers, throughput, percentile(timings, 50), percentile(timings, 99), throughput / single))
+    server.client.drop_database(server.db.name)
@@ -0,0 +1,65 @@
+#Shared helpers for the benchmark scripts. Every benchmark runs against a scratch database on a
+#local mongod so the development data in 'seg3102' is never touched.
+from __future__ import print_function
+import os
+import sys
+import threading
+import time
+from pymongo import monitoring
+
+BENCH_DB = os.environ.get('TMS_BENCH_DB', 'seg3102_bench')
+
+#Count every command the driver sends to mongod, so benchmarks can report round trips
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = {}
+
+    def started(self, event):
+        with self.lock:
+            self.commands[event.command_name] = self.commands.get(event.command_name, 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def reset(self):
+        with self.lock:
+            self.commands = {}
+
+    def total(self):
+        with self.lock:
+            return sum(self.commands.values())
+
+#Register the counter and import server against the scratch database.
+#Must run before anything else imports server, because listeners are bound when the MongoClient is built
+def load_server():
+    os.environ['TMS_MONGO_DB'] = BENCH_DB
+    counter = CommandCounter()
+    monitoring.register(counter)
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    import server
+    server.client.drop_database(BENCH_DB)
+    server.ensure_indexes()
+    return server, counter
+
+#Run fn `repeat` times and return (mean round trips, mean ms, p95 ms)
+def measure(fn, counter, repeat=20):
+    timings = []
+    trips = 0
+    for i in range(repeat):
+        counter.reset()
+        start = time.time()
+        fn()
+        timings.append((time.time() - start) * 1000)
+        trips += counter.total()
+    timings.sort()
+    return (float(trips) / repeat, sum(timings) / repeat, percentile(timings, 95))
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = int(round((pct / 100.0) * (len(sorted_values) - 1)))
+    return sorted_values[index]
@@ -0,0 +1,94 @@
+#Concurrency stress test for /joinTeams and /acceptMembers against a local mongod.
+#Many students request to join the same team at once, then the liaison accepts them one per request
+#from many threads; no request may be lost and the team may never grow past its maximum.
+#Usage: python benchmarks/stress_membership.py [--students 200] [--threads 32] [--max 10]
+from __future__ import print_function
+import argparse
+import json
+import threading
+from common import load_server
+
+server, counter = load_server()
+client = server.app.test_client()
+
+def seed(students, max_students):
+    password = server.encrypt("test") # hashed once, shared by every seeded user
+    instructor_id = server.instructor_users.insert_one(
+        {"username": "itest", "password": password, "email": "i@uottawa.ca", "firstName": "I", "lastName": "Test"}).inserted_id
+    server.student_users.insert_many([
+        {"username": "s%d" % i, "password": password, "email": "s%d@uottawa.ca" % i,
+         "firstName": "S", "lastName": str(i), "programOfStudy": "SEG"} for i in range(students + 1)
+    ])
+    server.migrate_user_directory()
+    course_id = server.courses.insert_one({"courseCode": "SEG3102", "courseSection": "A"}).inserted_id
+    team_param_id = server.team_params.insert_one({
+        "instructorId": instructor_id, "courseId": course_id,
+        "minimumNumberOfStudents": 1, "maximumNumberOfStudents": max_students, "deadline": "20/05/2030 23:59:00"
+    }).inserted_id
+    #s0 is the liaison
+    return server.teams.insert_one({
+        "teamParamId": team_param_id, "teamName": "Stress Team", "status": "incomplete", "teamSize": 1,
+        "teamMembers": ["s0"], "liason": "s0", "requestedMembers": []
+    }).inserted_id
+
+def token(username):
+    resp = client.post('/auth', data=json.dumps({"username": username, "password": "test"}), content_type='application/json')
+    return json.loads(resp.data)['access_token']
+
+def post(token, path, body):
+    return client.post(path, data=json.dumps(body), content_type='application/json',
+                       headers={"Authorization": "JWT " + token})
+
+def run_concurrently(jobs, threads):
+    lock = threading.Lock()
+    statuses = []
+    def worker():
+        while True:
+            with lock:
+                if not jobs:
+                    return
+                job = jobs.pop()
+            status = job().status_code
+            with lock:
+                statuses.append(status)
+    workers = [threading.Thread(target=worker) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return statuses
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--max', type=int, default=10)
+    args = parser.parse_args()
+
+    team_id = seed(args.students, args.max)
+    usernames = ["s%d" % i for i in range(1, args.students + 1)]
+    tokens = dict((username, token(username)) for username in usernames + ["s0"])
+
+    statuses = run_concurrently(
+        [lambda u=u: post(tokens[u], '/joinTeams', {"team_ids": [str(team_id)]}) for u in usernames], args.threads)
+    team = server.teams.find_one({"_id": team_id})
+    lost = set(usernames) - set(team['requestedMembers'])
+    print("joinTeams: %d requests, %d ok, %d lost updates" % (len(statuses), statuses.count(200), len(lost)))
+
+    statuses = run_concurrently(
+        [lambda u=u: post(tokens["s0"], '/acceptMembers', {"team_id": str(team_id), "list_of_usernames": [u]}) for u in usernames],
+        args.threads)
+    team = server.teams.find_one({"_id": team_id})
+    accepted = statuses.count(200)
+    print("acceptMembers: %d requests, %d ok, teamSize %d, %d members, status %s" % (
+        len(statuses), accepted, team['teamSize'], len(team['teamMembers']), team['status']))
+
+    ok = (not lost
+          and accepted == args.max - 1
+          and team['teamSize'] == len(team['teamMembers']) == args.max
+          and len(set(team['teamMembers'])) == args.max
+          and team['status'] == "complete"
+          and not set(team['teamMembers']) & set(team['requestedMembers']))
+    server.client.drop_database(server.db.name)
+    print("PASS" if ok else "FAIL")
+    raise SystemExit(0 if ok else 1)
@@ -1,319 +1,261 @@
-from pymongo import MongoClient
+#Development & load-test data, written to the database the server uses (TMS_MONGO_DB).
+#  python server.py seed             the small fixture set the Android client is developed against
+#  python dummyData.py --students N  a synthetic dataset of any size, see generate() for every option
+#Every seeded user's password is "test", hashed once and shared.
+from __future__ import print_function
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from pymongo import ReplaceOne
 import server
-from datetime import datetime
+
+SEED_PASSWORD = "test"
+
+#username, email, first name, last name. All students are in SEG
+STUDENTS = [
+    ("stest", "muraad@uottawa.ca", "Muraad", "Hared"),
+    ("stest2", "sarmad@uottawa.ca", "Sarmad", "Hashmi"),
+    ("stest3", "salman@uottawa.ca", "Salman", "Rana"),
+    ("stest4", "janac@uottawa.ca", "Janac", "Meena"),
+    ("stest5", "james@uottawa.ca", "James", "Bond"),
+    ("stest6", "bernard@uottawa.ca", "Bernard", "Jackson"),
+    ("stest7", "barry@uottawa.ca", "Barry", "Allen"),
+    ("stest8", "bobby@uottawa.ca", "Bobby", "Builder"),
+    ("stest9", "peter@uottawa.ca", "Peter", "Parker"),
+    ("stest10", "joe@uottawa.ca", "Joe", "Johnson"),
+    ("stest11", "tim@uottawa.ca", "Tim", "Turner"),
+    ("reqTest", "snake2@uottawa.ca", "Johnny", "Razor"),
+    ("reqTest2", "snake2@uottawa.ca", "Samantha", "Melo")
+]
+
+INSTRUCTORS = [
+    ("test", "instructor@uottawa.ca", "Instructor", "Muraad"),
+    ("test2", "instructor2@uottawa.ca", "Instructor", "Hashmi")
+]
+
+#course code, section, deadline of its team parameter. Both team parameters belong to instructor 'test'.
+#Deadlines are relative to when the data is seeded: past ones are closed by the deadline scheduler, which
+#would leave the fixture teams final & every create/join/accept refused. Seeding again reopens them
+SEEDED_AT = datetime.now().replace(second=0, microsecond=0)
+COURSES = [
+    ("SEG 3102", "A", SEEDED_AT + timedelta(days=60)),
+    ("SEG 3101", "B", SEEDED_AT + timedelta(days=30))
+]
+
+#course code, team name, status, members, liaison, requested members
+TEAMS = [
+    ("SEG 3101", "SEG Four", "complete", ["stest2", "stest3", "stest4", "stest5"], "stest2", []),
+    ("SEG 3101", "Binary Team", "incomplete", ["stest", "stest6"], "stest", ["stest7", "stest8", "stest9"]),
+    ("SEG 3101", "COOP Team", "incomplete", ["stest10", "stest11"], "stest10", []),
+    ("SEG 3102", "Best Team", "complete", ["stest2", "stest10", "stest11", "stest9"], "stest2", []),
+    ("SEG 3102", "Two Squad", "incomplete", ["stest", "stest8"], "stest", ["stest3", "stest4", "stest5"]),
+    ("SEG 3102", "Incomplete Fellows", "incomplete", ["stest6", "stest7"], "stest6", [])
+]
+
+#Upsert the fixture set, replacing records left by an earlier run. One bulk write per collection
 def dummy_data():
+    #Dates seeded by older versions were strings, convert them so the upserts below match
+    server.migrate_dates()
+    password = server.encrypt(SEED_PASSWORD)
+
+    server.student_users.bulk_write([
+        ReplaceOne({"username": username}, {
+            "username": username,
+            "password": password,
+            "email": email,
+            "firstName": first_name,
+            "lastName": last_name,
+            "programOfStudy": "SEG"
+        }, upsert=True)
+        for username, email, first_name, last_name in STUDENTS], ordered=False)
+    server.instructor_users.bulk_write([
+        ReplaceOne({"username": username}, {
+            "username": username,
+            "password": password,
+            "email": email,
+            "firstName": first_name,
+            "lastName": last_name,
+            "programOfStudy": "SEG"
+        }, upsert=True)
+        for username, email, first_name, last_name in INSTRUCTORS], ordered=False)
+    server.courses.bulk_write([
+        ReplaceOne({"courseCode": code, "courseSection": section}, {"courseCode": code, "courseSection": section}, upsert=True)
+        for code, section, deadline in COURSES], ordered=False)
 
-    #Connect to DB
-    client = MongoClient('mongodb://localhost:27017/')
-    db = client['seg3102']
-    users = db['users']
-    teams = db['teams']
-    student_users = db['students']
-    instructor_users = db['instructors']
-    team_params = db['teamParams']
-    courses = db['courses']
+    instructor = server.instructor_users.find_one({"username": INSTRUCTORS[0][0]}, {"_id": 1})
+    course_ids = dict((course['courseCode'], course['_id']) for course in server.courses.find(
+        {"$or": [{"courseCode": code, "courseSection": section} for code, section, deadline in COURSES]}))
+    server.team_params.bulk_write([
+        ReplaceOne({"instructorId": instructor['_id'], "courseId": course_ids[code]}, {
+            "instructorId": instructor['_id'],
+            "courseId": course_ids[code],
+            "minimumNumberOfStudents": 2,
+            "maximumNumberOfStudents": 4,
+            "deadline": deadline
+        }, upsert=True)
+        for code, section, deadline in COURSES], ordered=False)
 
-    #inserting Dummy Data IF data doesn't already exist
+    team_param_ids = dict((team_param['courseId'], team_param['_id']) for team_param in server.team_params.find(
+        {"instructorId": instructor['_id'], "courseId": {"$in": list(course_ids.values())}}, {"courseId": 1}))
+    server.teams.bulk_write([
+        ReplaceOne({"teamName": name}, {
+            "teamParamId": team_param_ids[course_ids[code]],
+            "teamName": name,
+            "dateOfCreation": datetime.now(),
+            "status": status,
+            "teamSize": len(members),
+            "teamMembers": members,
+            "liason": liason,
+            "requestedMembers": requested
+        }, upsert=True)
+        for code, name, status, members, liason, requested in TEAMS], ordered=False)
 
-    #Insert Users
-    ##Insert Students
-    student_users.replace_one({"username" : "stest"},
-                            {
-                            "username": "stest",
-                            "password": server.encrypt("test"),
-                            "email" : "muraad@uottawa.ca",
-                            "firstName" : "Muraad",
-                            "lastName" : "Hared",
-                            "programOfStudy" : "SEG"
-                            }
-                            , True)
+    #Mirror the seeded students & instructors into the users directory the auth path reads from
+    server.migrate_user_directory()
+    #and record the memberships of the seeded teams
+    server.rebuild_memberships()
+    for collection in (server.student_users, server.team_params, server.teams):
+        server.bump_revision(collection)
 
-    student_users.replace_one({"username" : "stest2"},
-                            {
-                            "username": "stest2",
-                            "password": server.encrypt("test"),
-                            "email" : "sarmad@uottawa.ca",
-                            "firstName" : "Sarmad",
-                            "lastName" : "Hashmi",
-                            "programOfStudy" : "SEG"
-                            }
-                            , True)
-    student_users.replace_one({"username" : "stest3"},
-                            {
-                            "username": "stest3",
-                            "password": server.encrypt("test"),
-                            "email" : "salman@uottawa.ca",
-                            "firstName" : "Salman",
-                            "lastName" : "Rana",
-                            "programOfStudy" : "SEG"
-                            }
-                            , True)
-    student_users.replace_one({"username" : "stest4"},
-                            {
-                            "username": "stest4",
-                            "password": server.encrypt("test"),
-                            "email" : "janac@uottawa.ca",
-                            "firstName" : "Janac",
-                            "lastName" : "Meena",
-                            "programOfStudy" : "SEG"
-                            }
-                            , True)
-    student_users.replace_one({"username" : "stest5"},
-                            {
-                            "username": "stest5",
-                            "password": server.encrypt("test"),
-                            "email" : "james@uottawa.ca",
-                            "firstName" : "James",
-                            "lastName" : "Bond",
-                            "programOfStudy" : "SEG"
-                            }
-                            , True)
-    student_users.replace_one({"username" : "stest6"},
-                            {
-                            "username": "stest6",
-                            "password": server.encrypt("test"),
-                            "email" : "bernard@uottawa.ca",
-                            "firstName" : "Bernard",
-                            "lastName" : "Jackson",
-                            "programOfStudy" : "SEG"
-                            }
-                            , True)
-    student_users.replace_one({"username" : "stest7"},
-                            {
-                            "username": "stest7",
-                            "password": server.encrypt("test"),
-                            "email" : "barry@uottawa.ca",
-                            "firstName" : "Barry",
-                            "lastName" : "Allen",
-                            "programOfStudy" : "SEG"
-                            }
-                            , True)
-    student_users.replace_one({"username" : "stest8"},
-                            {
-                            "username": "stest8",
-                            "password": server.encrypt("test"),
-                            "email" : "bobby@uottawa.ca",
-                            "firstName" : "Bobby",
-                            "lastName" : "Builder",
-                            "programOfStudy" : "SEG"
-                            }
-                            , True)
-    student_users.replace_one({"username" : "stest9"},
-                            {
-                            "username": "stest9",
-                            "password": server.encrypt("test"),
-                            "email" : "peter@uottawa.ca",
-                            "firstName" : "Peter",
-                            "lastName" : "Parker",
-                            "programOfStudy" : "SEG"
-                            }
-                            , True)
-    student_users.replace_one({"username" : "stest10"},
-                            {
-                            "username": "stest10",
-                            "password": server.encrypt("test"),
-                            "email" : "joe@uottawa.ca",
-                            "firstName" : "Joe",
-                            "lastName" : "Johnson",
-                            "programOfStudy" : "SEG"
-                            }
-                            , True)
-    student_users.replace_one({"username" : "stest11"},
-                            {
-                            "username": "stest11",
-                            "password": server.encrypt("test"),
-                            "email" : "tim@uottawa.ca",
-                            "firstName" : "Tim",
-                            "lastName" : "Turner",
-                            "programOfStudy" : "SEG"
-                            }
-                            , True)
-    
-    student_users.replace_one({"username" : "reqTest"},
-                            {
-                            "username": "reqTest",
-                            "password": server.encrypt("test"),
-                            "email" : "snake2@uottawa.ca",
-                            "firstName" : "Johnny",
-                            "lastName" : "Razor",
-                            "programOfStudy" : "SEG"
-                            }
-                            , True)
+FIRST_NAMES = ["Muraad", "Sarmad", "Salman", "Janac", "Amelia", "Noah", "Olivia", "Liam", "Emma", "Lucas",
+               "Chloe", "Ethan", "Zoe", "Omar", "Priya", "Wei", "Fatima", "Mateo", "Aisha", "Hiro"]
+LAST_NAMES = ["Hared", "Hashmi", "Rana", "Meena", "Tremblay", "Gagnon", "Roy", "Cote", "Bouchard", "Gauthier",
+              "Morin", "Lavoie", "Fortin", "Singh", "Nguyen", "Chen", "Ali", "Garcia", "Smith", "Martin"]
+PROGRAMS = ["SEG", "CSI", "CEG", "ELG", "MAT"]
 
-    student_users.replace_one({"username" : "reqTest2"},
-                            {
-                            "username": "reqTest2",
-                            "password": server.encrypt("test"),
-                            "email" : "snake2@uottawa.ca",
-                            "firstName" : "Samantha",
-                            "lastName" : "Melo",
-                            "programOfStudy" : "SEG"
-                            }
-                            , True)
-    ##Insert Instructors 
-    instructor_users.replace_one({"username" : "test"},
-                            {
-                            "username": "test",
-                            "password": server.encrypt("test"),
-                            "email" : "instructor@uottawa.ca",
-                            "firstName" : "Instructor",
-                            "lastName" : "Muraad",
-                            "programOfStudy" : "SEG"
-                            }
-                            , True)
+#Synthetic dataset for load tests, e.g. generate(students=100000, teams=20000).
+#The same seed always produces the same documents, _ids included. Students are named student0, student1, ...
+#and instructors instructor0, ...; every team parameter belongs to a course of its own, deadlines fall in
+#2030 so they stay open, and teams are spread evenly over the team parameters with between the minimum
+#and maximum number of members, no student being on two teams of a team parameter. With drop, the
+#collections are emptied first, otherwise generated usernames & team names must not exist yet.
+#Returns the number of documents written per collection
+def generate(students=1000, instructors=10, team_params=20, teams=200, seed=0, minimum=2, maximum=4,
+             requested=2, drop=False, batch_size=5000):
+    if team_params and not instructors:
+        raise ValueError("Team parameters need at least one instructor")
+    if teams and not team_params:
+        raise ValueError("Teams need at least one team parameter")
+    #Teams left to create per team parameter, spread evenly
+    left = [teams // team_params + (1 if k < teams % team_params else 0) for k in range(team_params)]
+    if left and max(left) * minimum > students:
+        raise ValueError("%d students cannot form %d teams of at least %d over %d team parameters"
+                         % (students, teams, minimum, team_params))
+    rng = random.Random(seed)
+    def object_id():
+        return ObjectId('%024x' % rng.getrandbits(96))
+    password = server.encrypt(SEED_PASSWORD)
+    written = {}
 
-    instructor_users.replace_one({"username" : "test2"},
-                            {
-                            "username": "test2",
-                            "password": server.encrypt("test"),
-                            "email" : "instructor2@uottawa.ca",
-                            "firstName" : "Instructor",
-                            "lastName" : "Hashmi",
-                            "programOfStudy" : "SEG"
-                            }
-                             , True)
+    if drop:
+        for collection in (server.users, server.student_users, server.instructor_users, server.courses,
+                           server.team_params, server.teams, server.memberships):
+            collection.drop()
 
-    ##Courses
-    courses.replace_one({"courseCode": "SEG 3102"},
-                   {
-                        "courseCode": "SEG 3102",
-                        "courseSection": "A"
-                    }, True)
-    courses.replace_one({"courseCode": "SEG 3101"},
-                   {
-                        "courseCode": "SEG 3101",
-                        "courseSection": "B"
-                    }, True)
+    student_documents = []
+    for i in range(students):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        student_documents.append({
+            "_id": object_id(),
+            "username": "student%d" % i,
+            "password": password,
+            "email": "%s.%s%d@uottawa.ca" % (first_name.lower(), last_name.lower(), i),
+            "firstName": first_name,
+            "lastName": last_name,
+            "programOfStudy": rng.choice(PROGRAMS)
+        })
+    instructor_documents = []
+    for i in range(instructors):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        instructor_documents.append({
+            "_id": object_id(),
+            "username": "instructor%d" % i,
+            "password": password,
+            "email": "instructor%d@uottawa.ca" % i,
+            "firstName": first_name,
+            "lastName": last_name
+        })
+    course_documents = [{"_id": object_id(), "courseCode": "GEN %d" % (1000 + i), "courseSection": rng.choice("ABCD")}
+                        for i in range(team_params)]
+    team_param_documents = [{
+        "_id": object_id(),
+        "instructorId": rng.choice(instructor_documents)['_id'],
+        "courseId": course['_id'],
+        "minimumNumberOfStudents": minimum,
+        "maximumNumberOfStudents": maximum,
+        "deadline": datetime(2030, 1, 1) + timedelta(minutes=rng.randint(0, 365 * 24 * 60))
+    } for course in course_documents]
 
-    ##Team Paramters
-    instructor = instructor_users.find_one({"username" : "test"})
-    course_3102 = courses.find_one({"courseCode" : "SEG 3102", "courseSection" : "A"})
-    course_3101 = courses.find_one({"courseCode" : "SEG 3101", "courseSection" : "B"})
-    team_params.replace_one(
-                {
-                    "instructorId" : instructor['_id'],
-                    "courseId" : course_3102['_id'],
-                    "minimumNumberOfStudents" : 2,
-                    "maximumNumberOfStudents" : 4,
-                    "deadline" : "02/11/2017 12:54:00"
-                },
-                {
-                    "instructorId" : instructor['_id'],
-                    "courseId" : course_3102['_id'],
-                    "minimumNumberOfStudents": 2,
-                    "maximumNumberOfStudents": 4,
-                    "deadline": "02/11/2017 12:54:00"
-                }
-                , True)
+    #Students not yet on a team, per team parameter, in a random order
+    available = []
+    for team_param in team_param_documents:
+        usernames = [student['username'] for student in student_documents]
+        rng.shuffle(usernames)
+        available.append(usernames)
+    team_documents = []
+    membership_documents = []
+    created = datetime(2029, 9, 1)
+    for i in range(teams):
+        team_param = team_param_documents[i % team_params]
+        pool = available[i % team_params]
+        left[i % team_params] -= 1
+        #Keep enough students for the teams this team parameter still has to get
+        size = min(rng.randint(minimum, maximum), len(pool) - left[i % team_params] * minimum)
+        members = [pool.pop() for j in range(size)]
+        team_id = object_id()
+        team_documents.append({
+            "_id": team_id,
+            "teamParamId": team_param['_id'],
+            "teamName": "Team %d" % i,
+            "dateOfCreation": created + timedelta(minutes=i),
+            "status": "complete" if size >= maximum else "incomplete",
+            "teamSize": size,
+            "teamMembers": members,
+            "liason": members[0],
+            "requestedMembers": rng.sample(pool, min(len(pool), rng.randint(0, requested))) if size < maximum else []
+        })
+        membership_documents.extend({"username": username, "teamParamId": team_param['_id'], "teamId": team_id}
+                                    for username in members)
 
-    team_params.replace_one(
-                {
-                    "instructorId" : instructor['_id'],
-                    "courseId" : course_3101['_id'],
-                    "minimumNumberOfStudents": 2,
-                    "maximumNumberOfStudents": 4,
-                    "deadline": "20/05/2017 23:59:00"
-                },
-                {
-                    "instructorId" : instructor['_id'],
-                    "courseId" : course_3101['_id'],
-                    "minimumNumberOfStudents": 2,
-                    "maximumNumberOfStudents": 4,
-                    "deadline": "20/05/2017 23:59:00"
-                }
-                , True)
+    for collection, documents in (
+            (server.student_users, student_documents),
+            (server.instructor_users, instructor_documents),
+            (server.users, [dict(student, role="student") for student in student_documents]
+                           + [dict(instructor, role="instructor") for instructor in instructor_documents]),
+            (server.courses, course_documents),
+            (server.team_params, team_param_documents),
+            (server.teams, team_documents),
+            (server.memberships, membership_documents)):
+        for start in range(0, len(documents), batch_size):
+            collection.insert_many(documents[start:start + batch_size], ordered=False)
+        written[collection.name] = len(documents)
 
-    #Teams
-    team_params_1 = team_params.find_one({"courseId": course_3101['_id']})
-    team_params_2 = team_params.find_one({"courseId": course_3102['_id']})
-    teams.replace_one(
-                {
-                    "teamName" : "SEG Four"
-                },
-                {
-                    "teamParamId" : team_params_1['_id'],
-                    "teamName" : "SEG Four",
-                    "dateOfCreation" : datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
-                    "status" : "complete",
-                    "teamSize" : 4,
-                    "teamMembers": ["stest2", "stest3", "stest4", "stest5"],
-                    "liason" : "stest2",
-                    "requestedMembers" : []                        
-                }, True)
-    
-    teams.replace_one(
-                {
-                    "teamName" : "Binary Team"
-                },
-                {
-                    "teamParamId" : team_params_1['_id'],
-                    "teamName" : "Binary Team",
-                    "dateOfCreation" : datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
-                    "status" : "incomplete",
-                    "teamSize" : 2,
-                    "teamMembers": ["stest", "stest6"],
-                    "liason" : "stest",
-                    "requestedMembers" : ["stest7","stest8","stest9"]                        
-                }, True)
+    #Indexes are built once on the loaded collections, rather than maintained through every insert
+    server.ensure_indexes()
+    for collection in (server.student_users, server.team_params, server.teams):
+        server.bump_revision(collection)
+    server.identity_cache.clear()
+    return written
 
-    teams.replace_one(
-                {
-                    "teamName" : "COOP Team"
-                },
-                {
-                    "teamParamId" : team_params_1['_id'],
-                    "teamName" : "COOP Team",
-                    "dateOfCreation" : datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
-                    "status" : "incomplete",
-                    "teamSize" : 2,
-                    "teamMembers": ["stest10", "stest11"],
-                    "liason" : "stest10",
-                    "requestedMembers" : []                        
-                }, True)
-    
-    
-    teams.replace_one(
-                {
-                    "teamName" : "Best Team"
-                },
-                {
-                    "teamParamId" : team_params_2['_id'],
-                    "teamName" : "Best Team",
-                    "dateOfCreation" : datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
-                    "status" : "complete",
-                    "teamSize" : 4,
-                    "teamMembers": ["stest2", "stest10", "stest11", "stest9"],
-                    "liason" : "stest2",
-                    "requestedMembers" : []                        
-                }, True)
-    
-    teams.replace_one(
-                {
-                    "teamName" : "Two Squad"
-                },
-                {
-                    "teamParamId" : team_params_2['_id'],
-                    "teamName" : "Two Squad",
-                    "dateOfCreation" : datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
-                    "status" : "incomplete",
-                    "teamSize" : 2,
-                    "teamMembers": ["stest", "stest8"],
-                    "liason" : "stest",
-                    "requestedMembers" : ["stest3","stest4","stest5"]                        
-                }, True)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic dataset to the database named by TMS_MONGO_DB")
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--instructors', type=int, default=10)
+    parser.add_argument('--team-params', type=int, default=20)
+    parser.add_argument('--teams', type=int, default=200)
+    parser.add_argument('--minimum', type=int, default=2, help="fewest members of a team")
+    parser.add_argument('--maximum', type=int, default=4, help="most members of a team")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--drop', action='store_true', help="empty the collections first")
+    args = parser.parse_args()
 
-    teams.replace_one(
-                {
-                    "teamName" : "Incomplete Fellows"
-                },
-                {
-                    "teamParamId" : team_params_2['_id'],
-                    "teamName" : "Incomplete Fellows",
-                    "dateOfCreation" : datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
-                    "status" : "incomplete",
-                    "teamSize" : 2,
-                    "teamMembers": ["stest6", "stest7"],
-                    "liason" : "stest6",
-                    "requestedMembers" : []                        
-                }, True)
-    
+    start = time.time()
+    written = generate(args.students, args.instructors, args.team_params, args.teams, args.seed,
+                       args.minimum, args.maximum, drop=args.drop)
+    for name in sorted(written):
+        print("%-12s %d" % (name, written[name]))
+    print("%.1f s" % (time.time() - start))
@@ -0,0 +1,36 @@
+#Production server for the TMS API:
+#  pip install gunicorn
+#  gunicorn -c gunicorn.conf.py server:app
+#Seeding is a separate step (python server.py seed), starting a worker never writes data.
+#Every setting can be overridden from the environment, e.g. TMS_WORKERS=8 TMS_BIND=0.0.0.0:8000
+import multiprocessing
+import os
+
+#Read by server.py when it is imported, so it has to be set before preload_app imports it
+os.environ.setdefault('TMS_DEBUG', '0')
+
+bind = os.environ.get('TMS_BIND', '0.0.0.0:3001')
+
+#Handlers spend most of their time waiting on mongod or bcrypt, both of which release the GIL,
+#so each process also runs a few threads. Throughput scales with workers up to the core count
+workers = int(os.environ.get('TMS_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('TMS_THREADS', 4))
+
+#Import server.py once in the arbiter and fork the workers from it. Nothing connects to mongod at import
+#(the MongoClient is created with connect=False), so each worker opens its own connection pool
+preload_app = True
+
+#Each open /events stream would hold one thread of its worker for as long as the client stays connected,
+#serve /events from gunicorn.events.conf.py instead. The timeout only applies to a worker that stops
+#responding, not to a long request of a gthread worker
+timeout = int(os.environ.get('TMS_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+#Recycle workers now and then, staggered so they do not all restart at once
+max_requests = int(os.environ.get('TMS_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('TMS_ACCESS_LOG', '-')
+errorlog = '-'
@@ -0,0 +1,30 @@
+#Server for the /events streams of the TMS API, run next to the one started from gunicorn.conf.py:
+#  pip install gunicorn gevent
+#  gunicorn -c gunicorn.events.conf.py server:app
+#A gthread worker gives each open stream one of its threads, so a few dozen idle clients leave no thread for
+#the API. Here a stream is a greenlet of a gevent worker and one process holds thousands of them.
+#Route /events to this server (e.g. an nginx location) and every other path to gunicorn.conf.py.
+#Events published by the API processes never reach this one, so it watches the teams collection instead
+#(TMS_EVENTS_CHANGE_STREAM, needs a replica set) and sends 'teamChanged' for every change to a team
+import os
+
+os.environ.setdefault('TMS_DEBUG', '0')
+os.environ.setdefault('TMS_EVENTS_CHANGE_STREAM', '1')
+
+bind = os.environ.get('TMS_EVENTS_BIND', '0.0.0.0:3002')
+
+#Streams are idle nearly all the time, a couple of processes are enough
+workers = int(os.environ.get('TMS_EVENTS_WORKERS', 2))
+worker_class = 'gevent'
+worker_connections = int(os.environ.get('TMS_EVENTS_CONNECTIONS', 5000)) # open streams per worker
+
+#The gevent worker patches threading & sockets when it starts. The app has to be imported after that, in the
+#worker, for its locks, queues & MongoClient to yield to the other streams
+preload_app = False
+
+timeout = int(os.environ.get('TMS_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = os.environ.get('TMS_ACCESS_LOG', '-')
+errorlog = '-'
@@ -1,32 +1,438 @@
-from collections import OrderedDict
-from pymongo import MongoClient
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import wraps
+import csv
+import hashlib
+import heapq
+import itertools
+import os
+import re
+import sys
+import threading
+try:
+    from Queue import Queue, Empty, Full
+except ImportError:
+    from queue import Queue, Empty, Full
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import time
+from pymongo import MongoClient, IndexModel, ReplaceOne, UpdateOne, ReturnDocument, ASCENDING, monitoring
+from pymongo.errors import DuplicateKeyError, BulkWriteError
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from bson import json_util, SON
 from flask import Flask
-from flask import jsonify
+from flask import jsonify as flask_jsonify
 from flask import request
+from flask import json, Response, stream_with_context, g, has_request_context
 from datetime import datetime, timedelta
 from flask_jwt import JWT, jwt_required, current_identity, JWTError
 import bcrypt
-import dummyData
 from datetime import datetime
 from voluptuous import Schema, Any, Required, All, Length, Range, MultipleInvalid, Invalid
 
 app = Flask(__name__)
-app.config["DEBUG"] = True
+app.config["DEBUG"] = os.environ.get('TMS_DEBUG', '1') == '1' # gunicorn.conf.py turns it off
 app.config["SECRET_KEY"] = 'supercomplexrandomvalue'
 app.config['JWT_EXPIRATION_DELTA'] = timedelta(seconds=7200) # token expires every 2 hours
 
-client = MongoClient('mongodb://localhost:27017/')
-db = client['seg3102']
+app.config['MONGO_URI'] = os.environ.get('TMS_MONGO_URI', 'mongodb://localhost:27017/')
+app.config['MONGO_DB'] = os.environ.get('TMS_MONGO_DB', 'seg3102')
+#Connection pool of each worker process, workers x MONGO_MAX_POOL_SIZE must stay below mongod's connection limit
+app.config['MONGO_MAX_POOL_SIZE'] = int(os.environ.get('TMS_MONGO_MAX_POOL_SIZE', 50))
+app.config['MONGO_CONNECT_TIMEOUT_MS'] = int(os.environ.get('TMS_MONGO_CONNECT_TIMEOUT_MS', 5000))
+app.config['MONGO_SERVER_SELECTION_TIMEOUT_MS'] = int(os.environ.get('TMS_MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+app.config['MONGO_SOCKET_TIMEOUT_MS'] = int(os.environ.get('TMS_MONGO_SOCKET_TIMEOUT_MS', 0)) or None # 0 waits forever
+app.config['MONGO_WAIT_QUEUE_TIMEOUT_MS'] = int(os.environ.get('TMS_MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000)) # waiting for a free connection
+app.config['IDENTITY_CACHE_SIZE'] = 1024 # users kept in the identity cache
+app.config['IDENTITY_CACHE_TTL'] = 60 # seconds before a cached user is looked up again
+app.config['STREAM_BATCH_SIZE'] = 500 # documents fetched per cursor batch & written per chunk by streamed lists
+app.config['STUDENTS_MAX_PAGE_SIZE'] = 500 # largest page GET /students returns
+app.config['TEAMS_MAX_PAGE_SIZE'] = 500 # largest page GET /teams returns
+app.config['IMPORT_MAX_TEAMS'] = 5000 # largest batch accepted by /importTeams
+app.config['DEADLINE_CHECK_INTERVAL'] = 60 # longest the deadline scheduler sleeps between checks, in seconds
+app.config['EVENTS_QUEUE_SIZE'] = 100 # events buffered per connection before further ones are dropped
+app.config['EVENTS_HEARTBEAT'] = 25 # seconds between keepalive comments on idle event streams
+app.config['EVENTS_CHANGE_STREAM'] = os.environ.get('TMS_EVENTS_CHANGE_STREAM') == '1' # needs a replica set
+app.config['BCRYPT_ROUNDS'] = int(os.environ.get('TMS_BCRYPT_ROUNDS', 12)) # cost factor for new password hashes
+app.config['BCRYPT_WORKERS'] = 4 # threads hashing passwords, bcrypt releases the GIL while hashing
+app.config['BCRYPT_QUEUE_LIMIT'] = 32 # hashes queued or running before new ones are rejected
+app.config['BCRYPT_TIMEOUT'] = 10 # seconds a request waits for its hash
+app.config['METRICS_ENABLED'] = os.environ.get('TMS_METRICS') == '1' # per-request timings served on /metrics
+app.config['METRICS_SERVER_TIMING'] = True # with METRICS_ENABLED, add a Server-Timing header to responses
+app.config['PROFILE_ROUTE'] = os.environ.get('TMS_PROFILE_ROUTE') # with METRICS_ENABLED, sample the stacks of this rule, e.g. /teams
+app.config['PROFILE_INTERVAL'] = 0.005 # seconds between stack samples
+app.config['SLOW_QUERY_MS'] = int(os.environ.get('TMS_SLOW_QUERY_MS', 0)) # record commands slower than this, 0 records none
+app.config['SLOW_QUERY_EXPLAIN'] = os.environ.get('TMS_SLOW_QUERY_EXPLAIN') == '1' # also capture the query plan of slow commands
+app.config['SLOW_QUERY_LOG_SIZE'] = 500 # slow commands kept for /admin/slowQueries, the oldest are dropped first
+app.config['REVISION_SETTLE_SECONDS'] = 5 # longest a write is expected to take, the clocks of all app servers must agree within it
+app.config['REVISION_PRUNE_SECONDS'] = 60 # age of the oldest stamp kept before the settled ones are dropped
+app.config['RESPONSE_CACHE_SIZE'] = 1024 # responses of read-mostly routes kept per process, 0 turns the cache off
+app.config['RESPONSE_CACHE_TTL'] = 300 # seconds an entry is served, bounds how long outdated revisions linger
+app.config['RESPONSE_CACHE_MAX_BYTES'] = 1024 * 1024 # larger responses are not cached
+app.config['RESPONSE_CACHE_URL'] = os.environ.get('TMS_RESPONSE_CACHE_URL') # e.g. redis://localhost:6379/0, shared by every worker
+app.config['LOOKUP_WORKERS'] = 16 # threads running the independent queries of a request concurrently, 0 runs them in turn
+
+DATE_FORMAT = '%d/%m/%Y %H:%M:%S' # how dates are exchanged with clients, they are stored as BSON datetimes
+
+AGGREGATE_BATCH_SIZE = 1000 # large enough that list endpoints come back in a single batch
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+#Fields of a student returned to clients, the password hash never leaves the database
+STUDENT_PROJECTION = {"username": 1, "firstName": 1, "lastName": 1, "programOfStudy": 1, "email": 1}
+
+#Per-request instrumentation, on with METRICS_ENABLED. A RequestMetrics collects what one request spent
+#on MongoDB, bcrypt & serialisation, the registry aggregates them per route for /metrics
+metrics_local = threading.local()
+
+try:
+    thread_time = time.thread_time
+except AttributeError:
+    #Python 2 has no per-thread clock, process CPU time overstates it when several requests run at once
+    thread_time = time.clock
+
+class RequestMetrics(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.cpu_start = thread_time()
+        self.commands = 0
+        self.seconds = {"db": 0.0, "bcrypt": 0.0, "json": 0.0}
+        self.streaming = False # finished when its body has been sent rather than in after_request
+
+    def add(self, name, seconds, commands=0):
+        with self.lock:
+            self.seconds[name] += seconds
+            self.commands += commands
+
+    def server_timing(self, wall):
+        return 'app;dur=%.1f, db;dur=%.1f;desc="%d commands", bcrypt;dur=%.1f, json;dur=%.1f' % (
+            wall * 1000, self.seconds['db'] * 1000, self.commands, self.seconds['bcrypt'] * 1000, self.seconds['json'] * 1000)
+
+def current_metrics():
+    return getattr(metrics_local, 'current', None)
+
+#Adds every command to the metrics of the request that sent it. Commands sent by gather() threads
+#count too, gather hands them the request's metrics
+class CommandMetrics(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        metrics = current_metrics()
+        if metrics is not None:
+            metrics.add("db", event.duration_micros / 1000000.0, 1)
+
+    def failed(self, event):
+        self.succeeded(event)
+
+class MetricsRegistry(object):
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, route, status, wall, cpu, metrics):
+        with self.lock:
+            stats = self.routes.get(route)
+            if stats is None:
+                stats = self.routes[route] = {"statuses": {}, "buckets": [0] * len(self.BUCKETS), "count": 0, "wall": 0.0,
+                                              "cpu": 0.0, "commands": 0, "db": 0.0, "bcrypt": 0.0, "json": 0.0}
+            stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+            for i, bound in enumerate(self.BUCKETS):
+                if wall <= bound:
+                    stats['buckets'][i] += 1
+            stats['count'] += 1
+            stats['wall'] += wall
+            stats['cpu'] += cpu
+            stats['commands'] += metrics.commands
+            for name, seconds in metrics.seconds.items():
+                stats[name] += seconds
+
+    #Prometheus text exposition format. Counters are per worker process
+    def render(self):
+        lines = []
+        def metric(name, kind, help_text, samples):
+            lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s %s" % (name, kind))
+            for labels, value in samples:
+                lines.append("%s{%s} %s" % (name, ",".join('%s="%s"' % label for label in labels), repr(value)))
+        with self.lock:
+            routes = sorted(self.routes.items())
+            metric("tms_requests_total", "counter", "Requests handled, by route and status",
+                   [((("route", route), ("status", status)), count) for route, stats in routes for status, count in sorted(stats['statuses'].items())])
+            lines.append("# HELP tms_request_duration_seconds Wall time of requests, by route")
+            lines.append("# TYPE tms_request_duration_seconds histogram")
+            for route, stats in routes:
+                for bound, count in zip(self.BUCKETS, stats['buckets']):
+                    lines.append('tms_request_duration_seconds_bucket{route="%s",le="%r"} %d' % (route, float(bound), count))
+                lines.append('tms_request_duration_seconds_bucket{route="%s",le="+Inf"} %d' % (route, stats['count']))
+                lines.append('tms_request_duration_seconds_sum{route="%s"} %r' % (route, stats['wall']))
+                lines.append('tms_request_duration_seconds_count{route="%s"} %d' % (route, stats['count']))
+            metric("tms_request_cpu_seconds_total", "counter", "CPU time of requests, by route", [((("route", route),), stats['cpu']) for route, stats in routes])
+            metric("tms_mongo_commands_total", "counter", "MongoDB commands sent, by route", [((("route", route),), stats['commands']) for route, stats in routes])
+            metric("tms_mongo_seconds_total", "counter", "Time spent on MongoDB commands, by route", [((("route", route),), stats['db']) for route, stats in routes])
+            metric("tms_bcrypt_seconds_total", "counter", "Time spent waiting for bcrypt, by route", [((("route", route),), stats['bcrypt']) for route, stats in routes])
+            metric("tms_serialize_seconds_total", "counter", "Time spent in jsonify, by route", [((("route", route),), stats['json']) for route, stats in routes])
+        with response_cache.lock:
+            metric("tms_response_cache_requests_total", "counter", "Requests to cached routes, by route and hit or miss",
+                   [((("route", route), ("result", result)), count) for route, stats in sorted(response_cache.stats.items()) for result, count in sorted(stats.items())])
+        with hashing_stats_lock:
+            for key, help_text in (("calls", "Passwords hashed or checked"), ("rejected", "Hashes refused, the pool was full"),
+                                   ("timeouts", "Hashes that took longer than BCRYPT_TIMEOUT")):
+                metric("tms_hashing_%s_total" % key, "counter", help_text + ", by kind",
+                       [((("kind", kind),), stats[key]) for kind, stats in sorted(hashing_stats.items())])
+            metric("tms_hashing_seconds_total", "counter", "Time requests waited for their hash, by kind",
+                   [((("kind", kind),), stats['total_seconds']) for kind, stats in sorted(hashing_stats.items())])
+            metric("tms_hashing_max_seconds", "gauge", "Longest wait for a hash since the worker started, by kind",
+                   [((("kind", kind),), stats['max_seconds']) for kind, stats in sorted(hashing_stats.items())])
+        return "\n".join(lines) + "\n"
+
+#Samples the stacks of the threads serving PROFILE_ROUTE, in the folded format flame graph tools read
+#(one 'frame;frame;frame count' line per distinct stack, e.g. for flamegraph.pl or speedscope)
+class StackSampler(object):
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.threads = set()
+        self.stacks = {}
+        self.thread = None
+        self.pid = None
+
+    def track(self, ident):
+        with self.lock:
+            self.threads.add(ident)
+            #Started on first use and again after a fork
+            if self.thread is None or self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self.run, name="stack-sampler")
+                self.thread.daemon = True
+                self.thread.start()
+
+    def untrack(self, ident):
+        with self.lock:
+            self.threads.discard(ident)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                idents = list(self.threads)
+            if not idents:
+                continue
+            frames = sys._current_frames()
+            for ident in idents:
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    stack.append("%s (%s:%d)" % (frame.f_code.co_name, os.path.basename(frame.f_code.co_filename), frame.f_code.co_firstlineno))
+                    frame = frame.f_back
+                if stack:
+                    key = ";".join(reversed(stack))
+                    with self.lock:
+                        self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def folded(self, reset=False):
+        with self.lock:
+            stacks = self.stacks
+            if reset:
+                self.stacks = {}
+        return "".join("%s %d\n" % (stack, count) for stack, count in sorted(stacks.items()))
+
+#Records commands slower than SLOW_QUERY_MS with the route that sent them into a bounded ring buffer,
+#optionally with the plan explain() gives for them, so a missing index shows up as a COLLSCAN
+#without turning on the database profiler
+class SlowQueryRecorder(monitoring.CommandListener):
+    #Parts of a command worth keeping, documents being written are left out
+    FIELDS = ("filter", "query", "pipeline", "sort", "projection", "key", "limit", "skip", "hint")
+    EXPLAINABLE = ("find", "aggregate", "count", "distinct", "update", "delete", "findAndModify")
+
+    def __init__(self, threshold_ms, size, explain):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.entries = deque(maxlen=size)
+        self.explain_queue = Queue(100)
+        self.explain_thread = None
+        self.explain_pid = None
+
+    def started(self, event):
+        if event.command_name != "explain":
+            with self.lock:
+                self.in_flight[(event.request_id, event.connection_id)] = (event.command, getattr(metrics_local, 'route', None))
+
+    def succeeded(self, event):
+        with self.lock:
+            started = self.in_flight.pop((event.request_id, event.connection_id), None)
+        if started is not None and event.duration_micros >= self.threshold_ms * 1000:
+            self.record(event, started[0], started[1])
+
+    def failed(self, event):
+        self.succeeded(event)
+
+    def record(self, event, command, route):
+        entry = {
+            "time": format_date(datetime.now()),
+            "route": route,
+            "command": event.command_name,
+            #getMore names its collection apart, the command's value being the cursor id
+            "collection": command.get("collection") if event.command_name == "getMore" else command.get(event.command_name),
+            "database": event.database_name,
+            "durationMs": event.duration_micros / 1000.0,
+            #Through extended JSON, so ObjectIds & dates can be returned by jsonify
+            "arguments": json.loads(json_util.dumps(dict((key, command[key]) for key in self.FIELDS if key in command))),
+            "plan": None,
+            "collscan": None
+        }
+        if event.command_name in ("update", "delete"):
+            statements = command.get("updates" if event.command_name == "update" else "deletes") or []
+            entry['arguments']['q'] = json.loads(json_util.dumps([statement.get("q") for statement in statements[:5]]))
+        with self.lock:
+            self.entries.append(entry)
+        app.logger.warning("Slow %s on %s: %.1f ms from %s", entry['command'], entry['collection'], entry['durationMs'], route)
+        if self.explain and event.command_name in self.EXPLAINABLE:
+            self.queue_explain(entry, event.database_name, command)
+
+    #Explained on a thread of its own, off the request's path
+    def queue_explain(self, entry, database_name, command):
+        with self.lock:
+            if self.explain_thread is None or self.explain_pid != os.getpid():
+                self.explain_pid = os.getpid()
+                self.explain_thread = threading.Thread(target=self.run_explains, name="slow-query-explain")
+                self.explain_thread.daemon = True
+                self.explain_thread.start()
+        explained = SON((key, value) for key, value in command.items() if not key.startswith("$") and key not in ("lsid", "txnNumber"))
+        try:
+            self.explain_queue.put_nowait((entry, database_name, explained))
+        except Full:
+            pass
+
+    def run_explains(self):
+        while True:
+            entry, database_name, command = self.explain_queue.get()
+            try:
+                plan = client[database_name].command("explain", command, verbosity="queryPlanner")['queryPlanner']['winningPlan']
+            except Exception:
+                app.logger.exception("Explaining a slow %s failed", entry['command'])
+                continue
+            with self.lock:
+                entry['plan'] = json.loads(json_util.dumps(plan))
+                entry['collscan'] = "COLLSCAN" in plan_stages(plan)
+
+    #Newest first, optionally only those of a route or those that scanned a collection
+    def query(self, route=None, collscan=None, limit=None):
+        with self.lock:
+            entries = [dict(entry) for entry in reversed(self.entries)
+                       if (route is None or entry['route'] == route) and (collscan is None or entry['collscan'] == collscan)]
+        return entries[:limit] if limit else entries
+
+#Every stage of a query plan, inputs included
+def plan_stages(plan):
+    stages = []
+    pending = [plan]
+    while pending:
+        stage = pending.pop()
+        stages.append(stage.get("stage"))
+        pending.extend(stage.get("inputStages", []))
+        for key in ("inputStage", "queryPlan", "outerStage", "innerStage"):
+            if key in stage:
+                pending.append(stage[key])
+    return stages
+
+command_metrics = CommandMetrics()
+slow_queries = SlowQueryRecorder(app.config['SLOW_QUERY_MS'], app.config['SLOW_QUERY_LOG_SIZE'], app.config['SLOW_QUERY_EXPLAIN'])
+metrics_registry = MetricsRegistry()
+stack_sampler = StackSampler(app.config['PROFILE_INTERVAL'])
+
+#connect=False defers connecting until the first operation, nothing at import touches the database, so a
+#server that imports the app before forking (gunicorn's preload_app) leaves every worker to open its own pool
+client = MongoClient(
+    app.config['MONGO_URI'],
+    connect=False,
+    maxPoolSize=app.config['MONGO_MAX_POOL_SIZE'],
+    connectTimeoutMS=app.config['MONGO_CONNECT_TIMEOUT_MS'],
+    serverSelectionTimeoutMS=app.config['MONGO_SERVER_SELECTION_TIMEOUT_MS'],
+    socketTimeoutMS=app.config['MONGO_SOCKET_TIMEOUT_MS'],
+    waitQueueTimeoutMS=app.config['MONGO_WAIT_QUEUE_TIMEOUT_MS'],
+    event_listeners=([command_metrics] if app.config['METRICS_ENABLED'] else [])
+                    + ([slow_queries] if app.config['SLOW_QUERY_MS'] > 0 else []))
+db = client[app.config['MONGO_DB']]
 users = db['users']
 student_users = db['students']
 instructor_users = db['instructors']
 team_params = db['teamParams']
 courses = db['courses']
 teams = db['teams']
+memberships = db['memberships']
+revisions = db['revisions']
+#users is the directory of every student and instructor, each with a 'role'. The auth path resolves users
+#from it in one query; the user also lives in the collection for its role, under the same _id
+#revisions holds a counter per collection clients can follow (see revision()), the ETags & deltas are built on them
+#memberships holds one {username, teamParamId, teamId} per team member. Its unique index is what enforces
+#"one team per team parameter", every write adding members to a team claims their memberships first
 
+#Every field the handlers filter on, per collection. Applied by ensure_indexes when a worker starts serving;
+#create_indexes is a no-op for indexes that already exist, so this is safe to run on every boot
+INDEXES = [
+    (users, [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True)
+    ]),
+    (student_users, [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("firstName", ASCENDING)], name="firstName"),
+        IndexModel([("lastName", ASCENDING)], name="lastName"),
+        IndexModel([("revision", ASCENDING)], name="revision")
+    ]),
+    (instructor_users, [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True)
+    ]),
+    (teams, [
+        IndexModel([("teamName", ASCENDING)], name="teamName_unique", unique=True),
+        IndexModel([("liason", ASCENDING)], name="liason"),
+        IndexModel([("teamParamId", ASCENDING), ("status", ASCENDING)], name="teamParamId_status"),
+        IndexModel([("teamMembers", ASCENDING)], name="teamMembers"),
+        IndexModel([("dateOfCreation", ASCENDING)], name="dateOfCreation"),
+        IndexModel([("revision", ASCENDING)], name="revision")
+    ]),
+    (team_params, [
+        IndexModel([("deadline", ASCENDING)], name="deadline")
+    ]),
+    (memberships, [
+        IndexModel([("username", ASCENDING), ("teamParamId", ASCENDING)], name="username_teamParamId_unique", unique=True),
+        IndexModel([("teamId", ASCENDING)], name="teamId")
+    ]),
+    (courses, [
+        IndexModel([("courseCode", ASCENDING), ("courseSection", ASCENDING)], name="courseCode_courseSection")
+    ])
+]
 
-def Date(fmt='%d/%m/%Y %H:%M:%S'):
+def ensure_indexes():
+    for collection, indexes in INDEXES:
+        collection.create_indexes(indexes)
+
+#Compare the registry with what exists in the database.
+#Returns a list of (collection, index name, problem) where problem is 'missing', 'unused' or 'unregistered'
+def index_report():
+    report = []
+    for collection, indexes in INDEXES:
+        expected = [index.document['name'] for index in indexes]
+        existing = collection.index_information()
+        for name in expected:
+            if name not in existing:
+                report.append((collection.name, name, 'missing'))
+        for name in existing:
+            if name != '_id_' and name not in expected:
+                report.append((collection.name, name, 'unregistered'))
+        for stats in collection.aggregate([{"$indexStats": {}}]):
+            if stats['name'] != '_id_' and stats['accesses']['ops'] == 0:
+                report.append((collection.name, stats['name'], 'unused'))
+    return report
+
+
+def Date(fmt=DATE_FORMAT):
     return lambda v: datetime.strptime(v, fmt)
 
 def validate_email(email):
@@ -57,17 +463,372 @@ schema = Schema({
             })
 
 
+#Bounded, thread-safe LRU cache whose entries expire after ttl seconds
+class LRUCache(object):
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.time():
+                return None
+            self.entries[key] = entry # re-insert as most recently used
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, time.time() + self.ttl)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def discard_where(self, predicate):
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if predicate(entry[0])]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+#Users resolved from JWT identities, keyed by the token identity (the user _id as a string)
+identity_cache = LRUCache(app.config['IDENTITY_CACHE_SIZE'], app.config['IDENTITY_CACHE_TTL'])
+
+#Drop cached identities for a username, call whenever a user document is inserted or changed
+def forget_identity(username):
+    identity_cache.discard_where(lambda user: user['username'] == username)
+
+#Response cache backend shared by every worker, for RESPONSE_CACHE_URL. Needs the redis package
+class RedisCacheBackend(object):
+    PREFIX = 'tms:response:'
+
+    def __init__(self, url, ttl):
+        import redis
+        self.client = redis.StrictRedis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get(self.PREFIX + key)
+        return json.loads(value.decode('utf-8')) if value is not None else None
+
+    def set(self, key, value):
+        self.client.setex(self.PREFIX + key, self.ttl, json.dumps(value))
+
+    #Entries cannot be found by collection. They are keyed by revision counter and settled revision, so
+    #nothing reads an entry again once a write has started, or for one built during the write, once it has
+    #settled; they expire
+    def discard_where(self, predicate):
+        pass
+
+#Responses of read-mostly routes (see cached_response), in an LRUCache or a shared backend, with the
+#hits & misses of each route
+class ResponseCache(object):
+    def __init__(self, backend):
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def get(self, key):
+        return self.backend.get(key) if self.backend is not None else None
+
+    def set(self, key, value):
+        if self.backend is not None:
+            self.backend.set(key, value)
+
+    #Drop every entry built from the collection, called by revision() once a write is done
+    def invalidate(self, collection_name):
+        if self.backend is not None:
+            self.backend.discard_where(lambda entry: collection_name in entry['collections'])
+
+    def record(self, route, hit):
+        with self.lock:
+            stats = self.stats.setdefault(route, {"hit": 0, "miss": 0})
+            stats["hit" if hit else "miss"] += 1
+
+if app.config['RESPONSE_CACHE_URL']:
+    response_cache = ResponseCache(RedisCacheBackend(app.config['RESPONSE_CACHE_URL'], app.config['RESPONSE_CACHE_TTL']))
+elif app.config['RESPONSE_CACHE_SIZE'] > 0:
+    response_cache = ResponseCache(LRUCache(app.config['RESPONSE_CACHE_SIZE'], app.config['RESPONSE_CACHE_TTL']))
+else:
+    response_cache = ResponseCache(None)
+
+#Serve a GET route from the response cache. Entries are keyed by the route, its arguments, the Accept header,
+#the role of the user (the user too with per_user) and the revision counter & settled revision of collections,
+#the ones the response is built from. A write to them moves the counter on as it starts, so no worker finds an
+#entry built before it again. An entry built while the write was in flight is found until the write has
+#settled, at most REVISION_SETTLE_SECONDS; the in-process cache of the worker that wrote drops it at once
+#(see revision()). Only 200 responses up to RESPONSE_CACHE_MAX_BYTES are kept, streamed ones as they are sent.
+#Requests with one of skip_args depend on the time and are not cached
+def cached_response(collections, per_user=False, skip_args=()):
+    names = [collection.name for collection in collections]
+    def decorator(view):
+        @wraps(view)
+        def cached_view(*args, **kwargs):
+            if response_cache.backend is None or any(arg in request.args for arg in skip_args):
+                return view(*args, **kwargs)
+            numbers = read_revisions(collections)
+            g.revisions = (names, numbers) # so conditional_get does not read them again
+            key = [request.path, sorted(request.args.items(multi=True)), request.headers.get('Accept', ''),
+                   current_identity.get('type'), numbers]
+            if per_user:
+                key.append(str(current_identity['_id']))
+            key = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+            route = request_route()
+
+            entry = response_cache.get(key)
+            if entry is not None:
+                response_cache.record(route, True)
+                if entry['etag'] and entry['etag'] in request.if_none_match:
+                    resp = Response(status=304)
+                else:
+                    resp = Response(entry['body'], status=entry['status'], mimetype=entry['mimetype'])
+                if entry['etag']:
+                    resp.set_etag(entry['etag'])
+                resp.headers['X-Cache'] = 'HIT'
+                return resp
+
+            response_cache.record(route, False)
+            resp = view(*args, **kwargs)
+            resp.headers['X-Cache'] = 'MISS'
+            if resp.status_code != 200:
+                return resp
+            entry = {"status": 200, "mimetype": resp.mimetype, "etag": resp.get_etag()[0], "collections": names}
+            if not resp.is_streamed:
+                if resp.content_length is None or resp.content_length <= app.config['RESPONSE_CACHE_MAX_BYTES']:
+                    entry['body'] = resp.get_data(as_text=True)
+                    response_cache.set(key, entry)
+                return resp
+
+            def tee(chunks):
+                body = []
+                size = 0
+                for chunk in chunks:
+                    if body is not None:
+                        body.append(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+                        size += len(body[-1])
+                        if size > app.config['RESPONSE_CACHE_MAX_BYTES']:
+                            body = None
+                    yield chunk
+                if body is not None:
+                    entry['body'] = b''.join(body).decode('utf-8')
+                    response_cache.set(key, entry)
+            resp.response = tee(resp.response)
+            return resp
+        return cached_view
+    return decorator
+
+#Parse a date in DATE_FORMAT, datetimes are returned as is. None if the value is not a valid date
+def parse_date(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.strptime(value, DATE_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+#Format a stored date for clients, values not migrated from strings yet are returned as is
+def format_date(value):
+    if isinstance(value, datetime):
+        return value.strftime(DATE_FORMAT)
+    return value
+
+#Convert team parameter deadlines & team creation dates stored as DATE_FORMAT strings to datetimes.
+#Returns the number of documents converted. Usage: python server.py migrate-dates
+def migrate_dates():
+    migrated = 0
+    for collection, field in ((team_params, "deadline"), (teams, "dateOfCreation")):
+        requests = []
+        for row in collection.find({field: {"$type": "string"}}, {field: 1}):
+            value = parse_date(row[field])
+            if value is not None:
+                requests.append(UpdateOne({"_id": row['_id'], field: row[field]}, {"$set": {field: value}}))
+        if requests:
+            migrated += collection.bulk_write(requests, ordered=False).modified_count
+    return migrated
+
+#Closes team parameters once their deadline passes. Deadlines wait in a heap ordered by time, a background
+#thread sleeps until the earliest one (or DEADLINE_CHECK_INTERVAL, to pick up parameters created by other
+#workers) and closes everything due in bulk. Handlers ask is_closed() instead of parsing deadlines
+class DeadlineScheduler(object):
+    def __init__(self, interval):
+        self.interval = interval
+        self.heap = []
+        self.closed = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.load() # the closed flags are known before any handler asks
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="deadline-scheduler")
+                self.thread.daemon = True
+                self.thread.start()
+
+    def schedule(self, team_param_id, deadline):
+        deadline = parse_date(deadline)
+        if deadline is not None:
+            with self.lock:
+                heapq.heappush(self.heap, (deadline, team_param_id))
+            self.wakeup.set()
+
+    def is_closed(self, team_param_id):
+        return team_param_id in self.closed
+
+    #Rebuild the heap & the closed flags from the database
+    def load(self):
+        heap = []
+        closed = set()
+        for row in team_params.find({}, {"deadline": 1, "closed": 1}):
+            if row.get('closed'):
+                closed.add(row['_id'])
+            else:
+                deadline = parse_date(row['deadline'])
+                if deadline is not None:
+                    heap.append((deadline, row['_id']))
+        heapq.heapify(heap)
+        with self.lock:
+            self.heap = heap
+            self.closed = closed
+
+    def close_due(self):
+        due = []
+        now = datetime.now()
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                due.append(heapq.heappop(self.heap)[1])
+        if due:
+            close_team_params(due)
+            self.closed.update(due)
+        with self.lock:
+            if self.heap:
+                return (self.heap[0][0] - now).total_seconds()
+        return None
+
+    def run(self):
+        next_load = time.time() + self.interval
+        while True:
+            try:
+                if time.time() >= next_load:
+                    self.load()
+                    next_load = time.time() + self.interval
+                until_next = self.close_due()
+            except Exception:
+                app.logger.exception("Closing team parameters failed")
+                until_next = None
+            timeout = self.interval if until_next is None else min(max(until_next, 0), self.interval)
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+
+#Close team parameters in bulk: their teams become final and pending join requests are dropped.
+#Every worker runs a scheduler, so each team parameter is first claimed with a conditional update; only the
+#worker that closed it writes its teams and bumps the revisions. Returns the ids this call closed
+def close_team_params(team_param_ids):
+    claim = ObjectId()
+    result = team_params.update_many({"_id": {"$in": team_param_ids}, "closed": {"$ne": True}},
+                                     {"$set": {"closed": True, "closedBy": claim}})
+    if result.modified_count == 0:
+        return []
+    if result.modified_count < len(team_param_ids):
+        team_param_ids = [row['_id'] for row in team_params.find({"_id": {"$in": team_param_ids}, "closedBy": claim}, {"_id": 1})]
+    with revision(team_params) as stamp:
+        team_params.update_many({"_id": {"$in": team_param_ids}}, {"$set": {"revision": stamp}})
+    with revision(teams) as stamp:
+        teams.update_many({"teamParamId": {"$in": team_param_ids}}, {"$set": {"final": True, "requestedMembers": [], "revision": stamp}})
+    return team_param_ids
+
+deadline_scheduler = DeadlineScheduler(app.config['DEADLINE_CHECK_INTERVAL'])
+
+#In-process publish/subscribe of events per username, feeding the /events streams of this process
+class EventBroker(object):
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, username):
+        queue = Queue(self.queue_size)
+        with self.lock:
+            self.subscribers.setdefault(username, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, username, queue):
+        with self.lock:
+            queues = self.subscribers.get(username)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self.subscribers[username]
+
+    def publish(self, username, event):
+        with self.lock:
+            queues = list(self.subscribers.get(username, ()))
+        for queue in queues:
+            try:
+                queue.put_nowait(event)
+            except Full:
+                pass # a client that stopped reading loses events rather than blocking the publisher
+
+event_broker = EventBroker(app.config['EVENTS_QUEUE_SIZE'])
+
+#Notify usernames of an event, unless a change stream already publishes every change to teams
+def notify(usernames, event_type, **fields):
+    if app.config['EVENTS_CHANGE_STREAM']:
+        return
+    event = dict(fields, type=event_type)
+    for username in usernames:
+        event_broker.publish(username, event)
+
+#With EVENTS_CHANGE_STREAM, every worker watches the teams collection and tells the liaison & members of a
+#changed team, so subscribers connected to any worker hear about writes made by every other worker
+def watch_team_changes():
+    while True:
+        try:
+            with teams.watch([{"$match": {"operationType": "update"}}], full_document='updateLookup') as stream:
+                for change in stream:
+                    team = change.get('fullDocument')
+                    if team is None:
+                        continue
+                    event = {"type": "teamChanged", "team_id": str(team['_id']), "teamName": team['teamName']}
+                    for username in set(team['teamMembers']) | set([team['liason']]):
+                        event_broker.publish(username, event)
+        except Exception:
+            app.logger.exception("Watching teams for changes failed, retrying")
+            time.sleep(5)
+
+#Started with the first request rather than at import, so every worker process runs its own threads
+#and nothing connects to the database before a pre-fork server has forked
+@app.before_first_request
+def start_background_threads():
+    ensure_indexes()
+    deadline_scheduler.start()
+    if app.config['EVENTS_CHANGE_STREAM']:
+        watcher = threading.Thread(target=watch_team_changes, name="team-change-stream")
+        watcher.daemon = True
+        watcher.start()
+
 def authenticate(username, password):
-    user = student_users.find_one({"username": username})
-    user_type = "student"
-    if user is None:
-        user = instructor_users.find_one({"username": username})
-        user_type = "instructor"
-    elif teams.find_one({"liason": username}):
-        user_type = "liason"
+    user = find_user({"username": username})
     if user:
-        user['type'] = user_type
-        passMatch = bcrypt.hashpw(password.encode('utf-8'), user['password'].encode('utf-8')) == user['password'].encode('utf-8')
+        user['type'] = user['role']
+        if user['role'] == "student" and user['isLiaison']:
+            user['type'] = "liason"
+        try:
+            passMatch = check_password(password, user['password'])
+        except HashingBusy:
+            raise JWTError('Server busy', 'Too many login attempts at the moment, please try again', status_code=503)
         if passMatch:                    
             return user
         else:
@@ -75,17 +836,238 @@ def authenticate(username, password):
     else:
         raise JWTError('Bad credentials', 'User not found!', status_code=404)
 
+#Resolve the token identity to its user, with 'type' set to 'student' or 'instructor'.
+#Flask-JWT calls this once per request, handlers read the result through current_identity
 def identity(payload):
     user_id = payload['identity']
     user = None
     if user_id:
-        user = student_users.find_one({"_id": ObjectId(user_id)})    
+        user = identity_cache.get(user_id)
         if user is None:
-            user = instructor_users.find_one({"_id": ObjectId(user_id)})                
+            user = users.find_one({"_id": ObjectId(user_id)})
+            if user is not None:
+                user['type'] = user['role']
+                identity_cache.set(user_id, user)
+        if user is not None:
+            user = dict(user) # handlers get their own copy
     return user
 
+#Resolve a user from the users directory in one query, query is on 'username' or '_id'.
+#Returns the user with its 'role' ('student' or 'instructor') and 'isLiaison' set, or None
+def find_user(query):
+    pipeline = [
+        {"$match": query},
+        {"$limit": 1},
+        {"$lookup": {"from": teams.name, "localField": "username", "foreignField": "liason", "as": "liaisonOf"}},
+        {"$addFields": {"isLiaison": {"$gt": [{"$size": "$liaisonOf"}, 0]}}},
+        {"$project": {"liaisonOf": 0}}
+    ]
+    for user in users.aggregate(pipeline):
+        return user
+    return None
+
+#Insert a new user into the users directory and the collection for its role, under the same _id.
+#Raises DuplicateKeyError if any user, student or instructor, already has the username
+def insert_user(collection, role, user):
+    user_id = users.insert_one(dict(user, role=role)).inserted_id
+    try:
+        with revision(collection) as stamp:
+            collection.insert_one(dict(user, _id=user_id, revision=stamp))
+    except DuplicateKeyError:
+        users.delete_one({"_id": user_id})
+        raise
+    forget_identity(user['username'])
+    return user_id
+
+#Rebuild the users directory from the students and instructors collections (e.g. after dummyData.dummy_data()).
+#Every user keeps the _id it has in its role collection
+def migrate_user_directory():
+    requests = []
+    user_ids = []
+    for collection, role in ((student_users, "student"), (instructor_users, "instructor")):
+        for user in collection.find():
+            user['role'] = role
+            user_ids.append(user['_id'])
+            requests.append(ReplaceOne({"_id": user['_id']}, user, upsert=True))
+    users.delete_many({"_id": {"$nin": user_ids}})
+    if requests:
+        users.bulk_write(requests, ordered=False)
+    identity_cache.clear()
+    return len(requests)
+
+#The current user if they are a student, otherwise None
+def current_student():
+    if current_identity['type'] == "student":
+        return current_identity._get_current_object()
+    return None
+
+#The current user if they are an instructor, otherwise None
+def current_instructor():
+    if current_identity['type'] == "instructor":
+        return current_identity._get_current_object()
+    return None
+
+#Raised when the hashing pool is saturated or a hash takes longer than BCRYPT_TIMEOUT
+class HashingBusy(Exception):
+    pass
+
+hashing_pool = None
+hashing_pool_pid = None
+hashing_pool_lock = threading.Lock()
+hashing_slots = threading.BoundedSemaphore(app.config['BCRYPT_QUEUE_LIMIT'])
+hashing_stats_lock = threading.Lock()
+hashing_stats = {
+    "hash": {"calls": 0, "rejected": 0, "timeouts": 0, "total_seconds": 0.0, "max_seconds": 0.0},
+    "verify": {"calls": 0, "rejected": 0, "timeouts": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+}
+
+#The pool is created lazily and again after a fork, worker threads do not survive fork()
+def get_hashing_pool():
+    global hashing_pool, hashing_pool_pid
+    with hashing_pool_lock:
+        if hashing_pool is None or hashing_pool_pid != os.getpid():
+            hashing_pool = ThreadPool(app.config['BCRYPT_WORKERS'])
+            hashing_pool_pid = os.getpid()
+        return hashing_pool
+
+def record_hashing(kind, key, seconds=None):
+    with hashing_stats_lock:
+        stats = hashing_stats[kind]
+        stats[key] += 1
+        if seconds is not None:
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+#Run fn on the hashing pool, the slot is released by the worker so timed out calls still count against the limit
+def run_hashing(kind, fn, *args):
+    if not hashing_slots.acquire(False):
+        record_hashing(kind, 'rejected')
+        raise HashingBusy()
+    def task():
+        try:
+            return fn(*args)
+        finally:
+            hashing_slots.release()
+    start = time.time()
+    try:
+        result = get_hashing_pool().apply_async(task).get(app.config['BCRYPT_TIMEOUT'])
+    except multiprocessing.TimeoutError:
+        record_hashing(kind, 'timeouts')
+        raise HashingBusy()
+    record_hashing(kind, 'calls', time.time() - start)
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.add("bcrypt", time.time() - start)
+    return result
+
 def encrypt(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    return run_hashing("hash", bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(app.config['BCRYPT_ROUNDS']))
+
+def check_password(password, hashed):
+    hashed = hashed.encode('utf-8')
+    return run_hashing("verify", bcrypt.hashpw, password.encode('utf-8'), hashed) == hashed
+
+lookup_pool = None
+lookup_pool_pid = None
+lookup_pool_lock = threading.Lock()
+
+#Like the hashing pool, created lazily and again after a fork
+def get_lookup_pool():
+    global lookup_pool, lookup_pool_pid
+    with lookup_pool_lock:
+        if lookup_pool is None or lookup_pool_pid != os.getpid():
+            lookup_pool = ThreadPool(app.config['LOOKUP_WORKERS'])
+            lookup_pool_pid = os.getpid()
+        return lookup_pool
+
+#Runs independent lookups concurrently and returns their results in order, so a handler waits for its
+#slowest query instead of the sum of them. Each call is a function followed by its arguments, e.g.
+#  team, students = gather((teams.find_one, query), (list, student_users.find(...)))
+#pymongo releases the GIL while waiting on the server, the first exception raised is re-raised here
+def gather(*calls):
+    if app.config['LOOKUP_WORKERS'] <= 0 or len(calls) < 2:
+        return [call[0](*call[1:]) for call in calls]
+    pool = get_lookup_pool()
+    pending = [pool.apply_async(run_with_metrics, (current_metrics(), getattr(metrics_local, 'route', None), call)) for call in calls]
+    return [result.get() for result in pending]
+
+def run_with_metrics(metrics, route, call):
+    metrics_local.current = metrics
+    metrics_local.route = route
+    try:
+        return call[0](*call[1:])
+    finally:
+        metrics_local.current = None
+        metrics_local.route = None
+
+#flask's jsonify, timed for the request metrics
+def jsonify(*args, **kwargs):
+    metrics = current_metrics()
+    if metrics is None:
+        return flask_jsonify(*args, **kwargs)
+    start = time.time()
+    resp = flask_jsonify(*args, **kwargs)
+    metrics.add("json", time.time() - start)
+    return resp
+
+def request_route():
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+@app.before_request
+def start_request_metrics():
+    metrics_local.route = request_route() # for the slow query log
+    if app.config['METRICS_ENABLED']:
+        metrics_local.current = RequestMetrics()
+        if app.config['PROFILE_ROUTE'] and request_route() == app.config['PROFILE_ROUTE']:
+            stack_sampler.track(threading.current_thread().ident)
+
+def finish_request_metrics(metrics, status, route):
+    metrics_local.current = None
+    stack_sampler.untrack(threading.current_thread().ident)
+    wall = time.time() - metrics.start
+    metrics_registry.record(route, status, wall, thread_time() - metrics.cpu_start, metrics)
+    return wall
+
+#Streamed responses are timed until their body has been sent, the cursor batches read while it is written
+#count towards them. Their Server-Timing header, sent before the body, only covers the time until then
+@app.after_request
+def record_request_metrics(resp):
+    metrics = current_metrics()
+    if metrics is not None:
+        route = request_route()
+        if resp.is_streamed:
+            metrics.streaming = True
+            metrics_local.current = None
+            resp.response = with_metrics(resp.response, metrics, route)
+            resp.call_on_close(lambda: finish_request_metrics(metrics, resp.status_code, route))
+            wall = time.time() - metrics.start
+        else:
+            wall = finish_request_metrics(metrics, resp.status_code, route)
+        if app.config['METRICS_SERVER_TIMING']:
+            resp.headers['Server-Timing'] = metrics.server_timing(wall)
+    return resp
+
+#Iterate the body of a streamed response with its request's metrics current
+def with_metrics(body, metrics, route):
+    metrics_local.current = metrics
+    metrics_local.route = route
+    try:
+        for chunk in body:
+            yield chunk
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+        metrics_local.current = None
+        metrics_local.route = None
+
+#Requests that raised never reach after_request. A streamed response runs the teardown once its body is
+#done, the close callback records it
+@app.teardown_request
+def record_failed_request_metrics(error):
+    metrics = current_metrics()
+    if metrics is not None and not metrics.streaming:
+        finish_request_metrics(metrics, 500, request_route())
+    metrics_local.route = None
 
 jwt = JWT(app, authenticate, identity)
 
@@ -146,9 +1128,7 @@ def register():
 
         if conforms_to_schema:
             #Check if user already exists
-            if student_users.find_one({"username": username}):                    
-                data['message'] = "A User with that username already exists"
-            elif instructor_users.find_one({"username": username}):                    
+            if users.find_one({"username": username}):
                 data['message'] = "A User with that username already exists"
             else:         
                 if(user_type.strip().lower() == "student"):
@@ -163,26 +1143,38 @@ def register():
                             data['message'] = "The program of study entered is not a valid program"
                             register = False
                         if register:
-                            res = student_users.insert_one({
+                            try:
+                                insert_user(student_users, "student", {
+                                        "username": username,
+                                        "password": encrypt(password),
+                                        "email" : email,
+                                        "firstName" : f_name,
+                                        "lastName" : l_name,
+                                        "programOfStudy" : program_of_study
+                                    })
+                                data['status'] = 200
+                                data['message'] = 'Student successfully registered!'
+                            except DuplicateKeyError:
+                                data['message'] = "A User with that username already exists"
+                            except HashingBusy:
+                                data['status'] = 503
+                                data['message'] = "The server is busy, please try again"
+                elif (user_type.strip().lower() == "instructor"):
+                    try:
+                        insert_user(instructor_users, "instructor", {
                                     "username": username,
                                     "password": encrypt(password),
                                     "email" : email,
                                     "firstName" : f_name,
-                                    "lastName" : l_name,
-                                    "programOfStudy" : program_of_study
+                                    "lastName" : l_name
                                 })
-                            data['status'] = 200
-                            data['message'] = 'Student successfully registered!'
-                elif (user_type.strip().lower() == "instructor"):
-                    res = instructor_users.insert_one({
-                                "username": username,
-                                "password": encrypt(password),
-                                "email" : email,
-                                "firstName" : f_name,
-                                "lastName" : l_name
-                            })
-                    data['status'] = 200
-                    data['message'] = 'Instructor successfully registered!'
+                        data['status'] = 200
+                        data['message'] = 'Instructor successfully registered!'
+                    except DuplicateKeyError:
+                        data['message'] = "A User with that username already exists"
+                    except HashingBusy:
+                        data['status'] = 503
+                        data['message'] = "The server is busy, please try again"
                 else:
                     data['message'] = 'The user type specified is not valid'
         
@@ -198,7 +1190,7 @@ def protected():
 @app.route('/createTeamParams', methods=['POST'])
 @jwt_required()
 def create_team_params():
-    user = instructor_users.find_one({'_id': current_identity['_id']})
+    user = current_instructor()
     required_keys = ['course_code', 'course_section','minimum_num_students', 'maximum_num_students', 'deadline']
     validation = validate_data_format(request, required_keys)
     valid_format = validation[0]
@@ -235,13 +1227,16 @@ def create_team_params():
                     if course is None:
                         data['message'] = "The course code with the specified section does not exist"
                     else:
-                        res = team_params.insert_one({
-                                "instructorId" : user['_id'],
-                                "courseId" : course['_id'],
-                                "minimumNumberOfStudents": minimum_number_of_students,
-                                "maximumNumberOfStudents": maximum_number_of_students,
-                                "deadline": deadline
-                            })
+                        with revision(team_params) as stamp:
+                            res = team_params.insert_one({
+                                    "instructorId" : user['_id'],
+                                    "courseId" : course['_id'],
+                                    "minimumNumberOfStudents": minimum_number_of_students,
+                                    "maximumNumberOfStudents": maximum_number_of_students,
+                                    "deadline": parse_date(deadline),
+                                    "revision": stamp
+                                })
+                        deadline_scheduler.schedule(res.inserted_id, deadline)
                         data['status'] = 200
                         data['message'] = 'Team Parameters were successfully created!'
         else:
@@ -252,35 +1247,39 @@ def create_team_params():
 
 @app.route('/teamParams', methods=['GET'])
 @jwt_required()
+@cached_response([team_params, teams], per_user=True, skip_args=('closing_within',))
 def get_team_params():
+    #Optional query parameter closing_within - only the team parameters whose deadline is within that many hours
+    #Supports conditional GET (If-None-Match)
+    etag, numbers, not_modified = conditional_get([team_params, teams], per_user=True)
+    if not_modified:
+        return not_modified
     data = {}
     data['status'] = 200
     teamParams = []
-    member_of_team = False
-    current_user = student_users.find_one({"_id" : current_identity['_id']})
-    if current_user is None:
-        current_user = instructor_users.find_one({"_id" : current_identity['_id']})
-    for row in team_params.find():
-        member_of_team = False
-        course = courses.find_one({'_id': row['courseId']})
-        instructor = instructor_users.find_one({'_id': row['instructorId']})
-        #search if user is a part of a team within the team param
-        for team in teams.find({"teamParamId" : row['_id']}):
-            if current_user['username'] in team['teamMembers']:
-                member_of_team = True      
+    closing_before = None
+    if 'closing_within' in request.args:
+        try:
+            closing_before = datetime.now() + timedelta(hours=float(request.args['closing_within']))
+        except (ValueError, OverflowError): # not a number, or too far away for a datetime
+            data['status'] = 404
+            data['message'] = "closing_within must be a number of hours"
+            resp = jsonify(data)
+            resp.status_code = data['status']
+            return resp
+    for row in open_team_params_for(current_identity['username'], closing_before):
         obj = {
             "_id": str(row['_id']),
-            "courseId": str(course['_id']),
-            "InstructorId": str(instructor['_id']),
-            "course_code": course['courseCode'],
-            "course_section": course['courseSection'],
-            "instructor_name": instructor['firstName'] + ' ' + instructor['lastName'],
-            "deadline": row['deadline'],
+            "courseId": str(row['course']['_id']),
+            "InstructorId": str(row['instructor']['_id']),
+            "course_code": row['course']['courseCode'],
+            "course_section": row['course']['courseSection'],
+            "instructor_name": row['instructor']['firstName'] + ' ' + row['instructor']['lastName'],
+            "deadline": format_date(row['deadline']),
             "minimumNumberOfStudents": row['minimumNumberOfStudents'],
-            "maximumNumberOfStudents": row['maximumNumberOfStudents'],         
+            "maximumNumberOfStudents": row['maximumNumberOfStudents'],
         }
-        if not member_of_team:
-            teamParams.append(obj) 
+        teamParams.append(obj)
     if len(teamParams) == 0:
         data['message'] = "You are already a member of a team in each team Parameter"   
     else:
@@ -288,6 +1287,7 @@ def get_team_params():
     data['teamParams'] = teamParams
     resp = jsonify(data)
     resp.status_code = data['status']
+    resp.set_etag(etag)
     return resp
 
 @app.route('/createTeam', methods=['POST'])
@@ -303,7 +1303,7 @@ def create_team():
             team_param_id = request.json['team_param_id']
             team_name = request.json['team_name']
             team_members = request.json['team_members']
-            liason = student_users.find_one({"_id" : current_identity['_id']})
+            liason = current_student()
             invalid_liason = True
             if liason:
                 liason = liason['username']
@@ -327,7 +1327,11 @@ def create_team():
                     data['message'] = e.msg + " for " + e.path[0]
                 
             if conforms_to_schema:
-                valid_info = invalid_object(team_param_id, team_params)
+                #The team parameter, the team name & the members do not depend on each other, fetch them together
+                valid_info, name_taken, students = gather(
+                    (invalid_object, team_param_id, team_params),
+                    (teams.find_one, {'teamName' : team_name}, {"_id": 1}),
+                    (list, student_users.find({"username" : {"$in": team_members}}, {"username": 1})))
                 invalid_team_param = valid_info[0]
                 teamParam = valid_info[1]
                 
@@ -335,96 +1339,277 @@ def create_team():
                     data['message'] = "You do not have permission to perform this operation"
                 elif invalid_team_param:
                     data['message'] = "No team parameter exists for the given team parameter ID"
+                elif deadline_scheduler.is_closed(teamParam['_id']):
+                    data['message'] = "The deadline of the team parameter has passed"
                 elif len(team_members) > teamParam['maximumNumberOfStudents']:
                     data['message'] = "You have selected too many members, the maximum number of members allowed is "+ str(teamParam['maximumNumberOfStudents']) 
                 elif len(team_members) < teamParam['minimumNumberOfStudents']:
                     data['message'] = "You did not provide enough members, the minimum number of members allowed is "+ str(teamParam['minimumNumberOfStudents'])
-                elif teams.find_one({'teamName' : team_name}): #Check within the teams with same teamparam (Valid to have different courses have teams with same name? 
+                elif name_taken: #Check within the teams with same teamparam (Valid to have different courses have teams with same name? 
                     data['message'] = "A team already exists with the given team name"
                 else:
                     #Check if each username in the list of team_members received is a valid student user
                     createTeam = True
                     members = []
+                    students = set(student['username'] for student in students)
                     for member in team_members:
-                        if student_users.find_one({"username" : member}) is None:
+                        if member not in students:
                             createTeam = False
                             data['message'] = member + " is not a valid Student username"
                             break
                         members.append(member)
 
-                    if createTeam:
-                        #Check if each student in team_members IS NOT in a team with the team param
-                        list_of_teams = teams.find({"teamParameterId" : teamParam['_id']})
-                        for team in list_of_teams:
-                            for student in team_members:
-                                if student in team['teamMembers']:
-                                    createTeam = False
-                                    data['message'] = student + ' is already in a team'
-                                    break
-
                     #If createTeam is still true, then we can insert a new team into the database
                     if createTeam:
-                        #Check if members is less than max team size
-                        less_than_max = len(members) < teamParam['maximumNumberOfStudents']
-                        if less_than_max:
-                            status = "incomplete"
+                        document = new_team(teamParam, team_name, members, liason)
+                        document['_id'] = ObjectId()
+                        #Check if each student in team_members IS NOT in a team with the team param
+                        rejected = add_memberships([(teamParam['_id'], document['_id'], members)])
+                        if rejected:
+                            data['message'] = rejected[document['_id']][0] + ' is already in a team'
                         else:
-                            status = "complete"
-                        
-                        res = teams.insert_one({
-                                "teamParamId" : teamParam['_id'],
-                                "teamName" : team_name,
-                                "dateOfCreation" : datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
-                                "status" : status,
-                                "teamSize" : len(members),
-                                "teamMembers": members,
-                                "liason" : liason,
-                                "requestedMembers" : []
-                                
-                            })
-                        data['status'] = 200
-                        data['message'] = 'Team was successfully created!'
+                            try:
+                                with revision(teams) as stamp:
+                                    document['revision'] = stamp
+                                    res = teams.insert_one(document)
+                                data['status'] = 200
+                                data['message'] = 'Team was successfully created!'
+                            except DuplicateKeyError:
+                                remove_memberships(document['_id'], members)
+                                data['message'] = "A team already exists with the given team name"
     resp = jsonify(data)
     resp.status_code = data['status']
     return resp
 
 
+#Values of each line of a UTF-8 CSV body, as unicode, or None when the body is not UTF-8. The csv module of
+#Python 2 only reads bytes, so the lines are encoded for it and every value decoded back
+def read_csv_lines(body):
+    try:
+        text = body.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    if sys.version_info[0] == 2:
+        return [[value.decode('utf-8') for value in line] for line in csv.reader(line.encode('utf-8') for line in text.splitlines())]
+    return list(csv.reader(text.splitlines()))
+
+#Create many teams of a team parameter at once. Use case: instructor forms teams from a class roster.
+#Accepts JSON {"team_param_id": ..., "teams": [{"team_name": ..., "team_members": [...], "liason": ...}]}
+#(liason defaults to the first member) or a UTF-8 CSV body with ?team_param_id=... and one team per line:
+#team name, then the member usernames, the first being the liason.
+#Every row is validated against the database with a constant number of queries and the valid rows are
+#inserted with one insert_many; the response reports the outcome of each row
+@app.route('/importTeams', methods=['POST'])
+@jwt_required()
+def import_teams():
+    data = {}
+    data['status'] = 404
+    user = current_instructor()
+    rows = None
+    team_param_id = None
+    if request.mimetype == 'text/csv':
+        team_param_id = request.args.get('team_param_id')
+        lines = read_csv_lines(request.get_data())
+        if lines is not None:
+            rows = []
+            for line in lines:
+                line = [value.strip() for value in line if value.strip()]
+                if line:
+                    rows.append({"team_name": line[0], "team_members": line[1:]})
+    elif request.json:
+        team_param_id = request.json.get('team_param_id')
+        rows = request.json.get('teams')
+
+    if user is None:
+        data['message'] = 'You do not have permission to import teams'
+    elif request.mimetype == 'text/csv' and rows is None:
+        data['message'] = 'The CSV body must be UTF-8 encoded'
+    elif not team_param_id or not isinstance(rows, list) or len(rows) == 0:
+        data['message'] = 'All fields must be provided!'
+    elif len(rows) > app.config['IMPORT_MAX_TEAMS']:
+        data['message'] = 'At most ' + str(app.config['IMPORT_MAX_TEAMS']) + ' teams can be imported at once'
+    else:
+        valid_info = invalid_object(team_param_id, team_params)
+        teamParam = valid_info[1]
+        if valid_info[0]:
+            data['message'] = "No team parameter exists for the given team parameter ID"
+        elif teamParam['instructorId'] != user['_id']:
+            data['message'] = "Only the instructor of the team parameter can import teams"
+        else:
+            report, documents = validate_team_rows(teamParam, rows)
+            if documents:
+                for document in documents:
+                    document['_id'] = ObjectId()
+                #Another request may have put students on a team or taken a team name since validation
+                rejected = add_memberships([(document['teamParamId'], document['_id'], document['teamMembers']) for document in documents])
+                created = []
+                for row, document in zip([row for row in report if row['status'] == "created"], documents):
+                    if document['_id'] in rejected:
+                        row['status'] = "rejected"
+                        row['message'] = rejected[document['_id']][0] + ' is already in a team'
+                    else:
+                        created.append((row, document))
+                if created:
+                    try:
+                        with revision(teams) as stamp:
+                            for row, document in created:
+                                document['revision'] = stamp
+                            teams.insert_many([document for row, document in created], ordered=False)
+                    except BulkWriteError as e:
+                        for error in e.details['writeErrors']:
+                            row, document = created[error['index']]
+                            row['status'] = "rejected"
+                            row['message'] = "A team already exists with the given team name"
+                            remove_memberships(document['_id'], document['teamMembers'])
+            data['report'] = report
+            data['created'] = len([row for row in report if row['status'] == "created"])
+            data['status'] = 200
+            data['message'] = str(data['created']) + ' of ' + str(len(report)) + ' teams were created'
+    resp = jsonify(data)
+    resp.status_code = data['status']
+    return resp
+
+#Place students that are not on a team of a team parameter into its teams. Use case: instructor handles
+#the students left over near the deadline. Body: {"team_param_id": ..., "usernames": [...class roster...],
+#"group_by_program": true, "dry_run": false}. Incomplete teams are filled first, the rest form new teams
+@app.route('/balanceTeams', methods=['POST'])
+@jwt_required()
+def balance_teams():
+    user = current_instructor()
+    required_keys = ['team_param_id', 'usernames']
+    validation = validate_data_format(request, required_keys)
+    valid_format = validation[0]
+    data = validation[1]
+
+    if user is None:
+        data['message'] = 'You do not have permission to balance teams'
+    elif valid_format:
+        usernames = request.json['usernames']
+        valid_info = invalid_object(request.json['team_param_id'], team_params)
+        teamParam = valid_info[1]
+        if valid_info[0]:
+            data['message'] = "No team parameter exists for the given team parameter ID"
+        elif teamParam['instructorId'] != user['_id']:
+            data['message'] = "Only the instructor of the team parameter can balance its teams"
+        elif not isinstance(usernames, list):
+            data['message'] = "usernames is not in the correct format"
+        else:
+            incomplete_teams = list(teams.find({"teamParamId": teamParam['_id'], "status": "incomplete"}, {"teamSize": 1}))
+            assigned = set(memberships.distinct("username", {"username": {"$in": usernames}, "teamParamId": teamParam['_id']}))
+            students = [student for student in student_users.find({"username": {"$in": usernames}}, {"username": 1, "programOfStudy": 1}).sort("_id", ASCENDING)
+                        if student['username'] not in assigned]
+            additions, new_teams, unassigned = plan_team_allocation(teamParam, incomplete_teams, students, request.json.get('group_by_program', True))
+            skipped_teams = 0
+            if not request.json.get('dry_run', False):
+                #Report what was written, the students of skipped teams were not placed
+                written, written_teams, skipped = apply_team_allocation(teamParam, incomplete_teams, additions, new_teams)
+                skipped_teams = len(additions) + len(new_teams) - len(written) - len(written_teams)
+                additions, new_teams, unassigned = written, written_teams, unassigned + skipped
+            data['filledTeams'] = dict((str(team_id), members) for team_id, members in additions.items())
+            data['newTeams'] = new_teams
+            data['unassigned'] = unassigned
+            data['skippedTeams'] = skipped_teams
+            data['status'] = 200
+            if skipped_teams:
+                data['message'] = str(skipped_teams) + " teams changed while balancing and were not filled, balance again to place their students"
+            else:
+                data['message'] = "Teams were successfully balanced"
+    resp = jsonify(data)
+    resp.status_code = data['status']
+    return resp
+
 @app.route('/students', methods=['GET'])
 @jwt_required()
+@cached_response([student_users])
 def get_students():
+    #Optional query parameters:
+    #  limit - page size, the response then carries 'next', the cursor for the following page
+    #  after - cursor returned as 'next' by the previous page
+    #  q - only students whose username, first name or last name starts with q
+    #  since - only students added or changed since that revision, the response carries the current 'revision'
+    #Supports conditional GET (If-None-Match)
+    etag, numbers, not_modified = conditional_get([student_users])
+    if not_modified:
+        return not_modified
     data = {}
-    data['status'] = 200
-    list_of_students = []
-    for row in student_users.find():
-        obj = {
-            "_id": str(row['_id']),
-            "username": row['username'],
-            "firstName": row['firstName'],
-            "lastName": row['lastName'],
-            "programOfStudy": row['programOfStudy'],
-            "email": row['email']
-            }
-        list_of_students.append(obj)
-    data['students'] = list_of_students
+    data['status'] = 404
+    query = {}
+    valid_args, limit = parse_page_args(query, data, app.config['STUDENTS_MAX_PAGE_SIZE'])
+    valid_args = parse_since_arg(query, data) and valid_args
+    if request.args.get('q'):
+        prefix = {"$regex": "^" + re.escape(request.args['q'])} # anchored so the indexes can be used
+        query['$or'] = [{"username": prefix}, {"firstName": prefix}, {"lastName": prefix}]
+
+    if valid_args:
+        cursor = student_users.find(query, STUDENT_PROJECTION).sort("_id", ASCENDING)
+        if limit:
+            cursor = cursor.limit(limit + 1) # one extra to know if there is a next page
+        list_of_students = []
+        for row in cursor:
+            row['_id'] = str(row['_id'])
+            list_of_students.append(row)
+        data['students'] = page_of(list_of_students, limit, data)
+        data['revision'] = numbers[0]
+        data['status'] = 200
     resp = jsonify(data)
     resp.status_code = data['status']
+    if data['status'] == 200:
+        resp.set_etag(etag)
     return resp
 
 #Use case : Visualize student Teams
 @app.route('/teams', methods=['GET'])
 @jwt_required()
 def get_teams():
+    #Optional query parameters, each narrows the teams returned:
+    #  teamParam_id, status ('complete' or 'incomplete'), member (username in teamMembers), liason,
+    #  created_since (teams created at or after that date)
+    #  limit & after - pages of teams, as for /students
+    #  since - only teams created or changed since that revision, the response carries the current 'revision'
+    #Supports conditional GET (If-None-Match)
+    etag, numbers, not_modified = conditional_get([teams])
+    if not_modified:
+        return not_modified
     data = {}
-    data['status'] = 200
-    list_of_teams = []
-    for row in teams.find():
-        row['_id'] = str(row['_id'])
-        row['teamParamId'] = str(row['teamParamId'])
-        list_of_teams.append(row)
-    data['teams'] = list_of_teams
-    resp = jsonify(data)
-    resp.status_code = data['status']
+    data['status'] = 404
+    query = {}
+    valid_args, limit = parse_page_args(query, data, app.config['TEAMS_MAX_PAGE_SIZE'])
+    valid_args = parse_since_arg(query, data) and valid_args
+    if 'teamParam_id' in request.args:
+        try:
+            query['teamParamId'] = ObjectId(request.args['teamParam_id'])
+        except InvalidId:
+            valid_args = False
+            data['message'] = "teamParam_id is not a valid team parameter id"
+    if 'status' in request.args:
+        query['status'] = request.args['status']
+    if 'member' in request.args:
+        query['teamMembers'] = request.args['member']
+    if 'liason' in request.args:
+        query['liason'] = request.args['liason']
+    if 'created_since' in request.args:
+        created_since = parse_date(request.args['created_since'])
+        if created_since is None:
+            valid_args = False
+            data['message'] = "created_since must be a date formatted as dd/mm/yyyy hh:mm:ss"
+        else:
+            query['dateOfCreation'] = {"$gte": created_since}
 
+    if not valid_args:
+        resp = jsonify(data)
+        resp.status_code = data['status']
+        return resp
+    data['status'] = 200
+    data['revision'] = numbers[0]
+    cursor = teams.find(query).sort("_id", ASCENDING)
+    if limit:
+        #A page is small, so it is read whole to find out whether there is a next one
+        list_of_teams = page_of([serialize_team(team) for team in cursor.limit(limit + 1)], limit, data)
+        resp = stream_json(data, 'teams', list_of_teams)
+    else:
+        cursor = cursor.batch_size(app.config['STREAM_BATCH_SIZE'])
+        resp = stream_json(data, 'teams', (serialize_team(team) for team in cursor))
+    resp.set_etag(etag)
     return resp
 
 #Use case Join Team goes against our design. A student can only join if they are not in a team already
@@ -439,45 +1624,76 @@ def join_teams():
 
     if valid_format:
         team_ids = request.json['team_ids']
-        #Check if team_ids are valid
-        invalid_team_ids = False
-        
-        for id in team_ids:
-            invalid_team_ids = invalid_object(id, teams)[0]
-            if invalid_team_ids:
-                break
-        if invalid_team_ids:
-            data['message'] = 'A team with id: ' + id + ' does not exist'
-        else:
-            user = student_users.find_one({"_id": current_identity['_id']})
-            if user is None:
-                user = instructor_users.find_one({"_id" : current_identity['_id']})
-            username = user['username']
-
-            #Check if user already in teams/user already requested teams
-            invalid_team_selection = False
-            for team in team_ids:
-                current_team = teams.find_one({"_id" : ObjectId(team)})
-                if username in current_team['requestedMembers'] or username in current_team['teamMembers']:
-                    invalid_team_selection = True
-                    break
+        username = current_identity['username']
+        #Outcome per requested id, returned to the client: 'does not exist', 'already a member',
+        #'already requested', 'closed' or 'requested'
+        results = OrderedDict()
+        object_ids = OrderedDict()
+        for team_id in team_ids:
+            try:
+                object_ids[team_id] = ObjectId(team_id)
+            except (InvalidId, TypeError):
+                results[team_id] = "does not exist"
 
-            if invalid_team_selection:
-                data['message'] = "You are already a member/requestedMember of one or more teams selected"
+        #One query validates every id & the user's membership of each team
+        found = {}
+        for team in teams.find({"_id": {"$in": list(object_ids.values())}}, {"teamMembers": 1, "requestedMembers": 1, "teamParamId": 1, "liason": 1, "teamName": 1}):
+            found[team['_id']] = team
+        for team_id, object_id in object_ids.items():
+            team = found.get(object_id)
+            if team is None:
+                results[team_id] = "does not exist"
+            elif username in team['teamMembers']:
+                results[team_id] = "already a member"
+            elif username in team['requestedMembers']:
+                results[team_id] = "already requested"
+            elif deadline_scheduler.is_closed(team['teamParamId']):
+                results[team_id] = "closed"
             else:
-                for team in team_ids:
-                    current_team = teams.find_one({"_id" : ObjectId(team)})
-                    requests = current_team['requestedMembers']
-                    requests.append(username)
-                    teams.update_one(
-                        {
-                            "_id": current_team['_id']
-                        },
-                        {
-                            "$set": {"requestedMembers": requests}
-                        })
-                data['status'] = 200
-                data['message'] = 'Successfully joined teams'
+                results[team_id] = "requested"
+
+        missing = [team_id for team_id in team_ids if results[team_id] == "does not exist"]
+        if missing:
+            data['message'] = 'A team with id: ' + missing[0] + ' does not exist'
+        elif any(results[team_id] == "closed" for team_id in team_ids):
+            data['message'] = "The deadline to join one or more teams selected has passed"
+        elif any(results[team_id] != "requested" for team_id in team_ids):
+            data['message'] = "You are already a member/requestedMember of one or more teams selected"
+        else:
+            #Conditional writes, concurrent joins cannot overwrite each other's requests.
+            #An empty list of ids is a no-op, as before, bulk_write refuses an empty batch
+            applied = []
+            if object_ids:
+                with revision(teams) as stamp:
+                    written = teams.bulk_write([
+                        UpdateOne(
+                            {
+                                "_id": object_id,
+                                "requestedMembers": {"$ne": username},
+                                "teamMembers": {"$ne": username}
+                            },
+                            {
+                                "$addToSet": {"requestedMembers": username},
+                                "$set": {"revision": stamp}
+                            })
+                        for object_id in object_ids.values()], ordered=False)
+                applied = list(object_ids.values())
+                if written.matched_count < len(applied):
+                    #A concurrent request got to some teams first. The teams this one wrote carry its stamp
+                    applied = []
+                    for team in teams.find({"_id": {"$in": list(object_ids.values())}}, {"teamMembers": 1, "revision": 1}):
+                        if team.get('revision') == stamp:
+                            applied.append(team['_id'])
+                        else:
+                            found[team['_id']]['teamMembers'] = team['teamMembers']
+                    for team_id, object_id in object_ids.items():
+                        if object_id not in applied:
+                            results[team_id] = "already a member" if username in found[object_id]['teamMembers'] else "already requested"
+            for object_id in applied:
+                notify([found[object_id]['liason']], "joinRequest", team_id=str(object_id), teamName=found[object_id]['teamName'], username=username)
+            data['status'] = 200
+            data['message'] = 'Successfully joined teams'
+        data['results'] = results
     resp = jsonify(data)
     resp.status_code = data['status']
     return resp
@@ -488,7 +1704,7 @@ def join_teams():
 def view_requested_members():
     data = {}
     data['status'] = 404
-    current_user = student_users.find_one({"_id": ObjectId(current_identity['_id'])})
+    current_user = current_student()
     
     if current_user:
         if 'team_id' in request.args:
@@ -518,7 +1734,7 @@ def view_requested_members():
 @app.route('/acceptMembers', methods=['POST'])
 @jwt_required()
 def accept_members():
-    current_user = student_users.find_one({"_id": ObjectId(current_identity['_id'])})
+    current_user = current_student()
     required_keys = ['team_id','list_of_usernames']
     validation = validate_data_format(request, required_keys)
     valid_format = validation[0]
@@ -528,7 +1744,7 @@ def accept_members():
         data['message'] = 'You do not have permission to accept new members'
     elif valid_format:  
         team_id = request.json['team_id']
-        list_of_usernames = request.json['list_of_usernames']
+        list_of_usernames = list(OrderedDict.fromkeys(request.json['list_of_usernames'])) # drop duplicates, keep order
         team_validation = invalid_object(team_id, teams) 
         invalid_team = team_validation[0]
         team = team_validation[1] # None if invalid _team is true
@@ -543,17 +1759,21 @@ def accept_members():
             data['message'] = "The members you would like to add to team must be provided"
         elif team['status'] == "complete":
             data['message'] = "The team selected already has the maximum number of members"
+        elif deadline_scheduler.is_closed(team['teamParamId']):
+            data['message'] = "The deadline of the team parameter has passed"
         else:
+            students, team_param = gather(
+                (list, student_users.find({"username": {"$in": list_of_usernames}}, {"username": 1})),
+                (team_params.find_one, {"_id" : team['teamParamId']}, {"maximumNumberOfStudents": 1}))
+            students = set(student['username'] for student in students)
             for username in list_of_usernames:
-                student = student_users.find_one({"username": username})
-                if student is None:
+                if username not in students:
                     invalid_users = True
                     break
                 elif username in team['teamMembers']:
                     users_in_team = True
                     break
 
-            team_param = team_params.find_one({"_id" : team['teamParamId']})
             max_students = team_param['maximumNumberOfStudents']
 
             if invalid_users:
@@ -563,37 +1783,78 @@ def accept_members():
             elif (len(list_of_usernames) + int(team['teamSize'])) > max_students:
                 data['message'] = "Maximum number of students is exceeded if all selected students are added to team"
             else:
-                members = team['teamMembers'] + list_of_usernames
-                requests = team['requestedMembers']
-                #Remove the members in the requests that are going to be added
-                for member in members:
-                    if member in requests:
-                        requests.remove(member)
-
-                if len(members) == max_students:
-                    status = "complete"
+                team_id = team['_id']
+                rejected = add_memberships([(team['teamParamId'], team_id, list_of_usernames)])
+                if rejected:
+                    data['message'] = rejected[team_id][0] + " is already in a team"
+                    team = None
                 else:
-                    status = "incomplete"
-                teams.update_one(
-                    {
-                        "_id": team['_id']
-                    },
-                    {
-                        "$set": {"teamMembers": members, "status": status, "requestedMembers" : requests, "teamSize" : len(members)}
-                    })
-                data['message'] = "Successfully added selected users to team"
-                data['status'] = 200
+                    #The filter only lets the write apply while the team has room for every student, so concurrent
+                    #accepts that fit together all succeed. The status follows from the size after the write: only
+                    #the accept that fills the team needs a second write to mark it complete
+                    with revision(teams) as stamp:
+                        team = teams.find_one_and_update(
+                            {
+                                "_id": team_id,
+                                "teamMembers": {"$nin": list_of_usernames},
+                                "teamSize": {"$lte": max_students - len(list_of_usernames)}
+                            },
+                            {
+                                "$push": {"teamMembers": {"$each": list_of_usernames}},
+                                "$pull": {"requestedMembers": {"$in": list_of_usernames}},
+                                "$inc": {"teamSize": len(list_of_usernames)},
+                                "$set": {"revision": stamp}
+                            },
+                            return_document=ReturnDocument.AFTER)
+                        if team is not None and team['teamSize'] >= max_students:
+                            teams.update_one({"_id": team_id, "teamSize": team['teamSize']}, {"$set": {"status": "complete"}})
+                    if team is None:
+                        remove_memberships(team_id, list_of_usernames)
+                        data['message'] = "The team no longer has room for all selected students"
+                if team is not None:
+                    notify(list_of_usernames, "accepted", team_id=str(team_id), teamName=team['teamName'])
+                    data['message'] = "Successfully added selected users to team"
+                    data['status'] = 200
     resp = jsonify(data)
     resp.status_code = data['status']
     return resp
 
+#Server-sent events for the current user, instead of polling /viewRequestedMembers & /liasionTeams.
+#Liaisons get 'joinRequest' when a student asks to join their team, students get 'accepted' when a liaison
+#admits them (or 'teamChanged' for any change to their teams when EVENTS_CHANGE_STREAM is on)
+@app.route('/events', methods=['GET'])
+@jwt_required()
+def events():
+    username = current_identity['username']
+    queue = event_broker.subscribe(username)
+    heartbeat = app.config['EVENTS_HEARTBEAT']
+
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = queue.get(timeout=heartbeat)
+                except Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield 'event: ' + event['type'] + '\ndata: ' + json.dumps(event) + '\n\n'
+        finally:
+            event_broker.unsubscribe(username, queue)
+
+    resp = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no' # let events through proxies such as nginx unbuffered
+    return resp
+
 #Return the incomplete teams with the specified team parameter 
 @app.route('/teamsInTeamParam', methods=['GET'])
 @jwt_required()
+@cached_response([team_params, teams])
 def get_incomplete_teams_with_teamParam():
     data = {}
     data['status'] = 404
-    current_user = student_users.find_one({"_id": ObjectId(current_identity['_id'])})
+    current_user = current_student()
     if current_user is None:
         data['message'] = "You do not have permission to perform this operation"
     elif 'teamParam_id' in request.args:
@@ -603,14 +1864,9 @@ def get_incomplete_teams_with_teamParam():
         if invalid_teamParam_id:
             data['message'] = "A team Parameter with id: '" + teamParam_id + "' does not exist"
         else:
-            list_of_teams = []
-            for team in teams.find({'teamParamId' : ObjectId(teamParam_id) , 'status' : 'incomplete' }):
-                team['teamParamId'] = str(team['teamParamId'])
-                team['_id'] = str(team['_id'])
-                list_of_teams.append(team)
-
-            data['list_of_teams'] = list_of_teams
+            cursor = teams.find({'teamParamId' : ObjectId(teamParam_id) , 'status' : 'incomplete' }).batch_size(app.config['STREAM_BATCH_SIZE'])
             data['status'] = 200
+            return stream_json(data, 'list_of_teams', (serialize_team(team) for team in cursor))
             
     else: 
         data['message'] = "The team Parameter was not provided"
@@ -628,20 +1884,15 @@ def get_incomplete_teams_with_teamParam():
 def get_liasion_teams():
     data = {}
     data['status'] = 404
-    current_user = student_users.find_one({"_id" : current_identity['_id']})
+    current_user = current_student()
     if current_user:
-        db_teams = teams.find({"liason" : current_user['username']})
-        number_of_teams = db_teams.count()
-        if number_of_teams == 0:
+        db_teams = teams.find({"liason" : current_user['username']}).batch_size(app.config['STREAM_BATCH_SIZE'])
+        first_team = next(db_teams, None) # peek instead of a separate count() round trip
+        if first_team is None:
             data['message'] = "You are not a liasion of any team"
         else:
-            list_of_teams = []
-            for team in db_teams:
-                team['teamParamId'] = str(team['teamParamId'])
-                team['_id'] = str(team['_id'])
-                list_of_teams.append(team)
-        
-            data['teams'] = list_of_teams
+            data['status'] = 200
+            return stream_json(data, 'teams', (serialize_team(team) for team in itertools.chain([first_team], db_teams)))
     else:
         data['message'] = "You do not have permission to perform this operation"        
 
@@ -651,7 +1902,444 @@ def get_liasion_teams():
 
     return resp
 
+#Request metrics of this worker process in the Prometheus text format, with METRICS_ENABLED.
+#Unauthenticated so Prometheus can scrape it, keep it off the public network
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    if not app.config['METRICS_ENABLED']:
+        data = {'status': 404, 'message': "Metrics are not enabled"}
+        resp = jsonify(data)
+        resp.status_code = data['status']
+        return resp
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+#Stacks sampled from requests to PROFILE_ROUTE, folded for flame graph tools. ?reset=1 starts a new profile
+@app.route('/metrics/profile', methods=['GET'])
+def get_profile():
+    if not app.config['METRICS_ENABLED'] or not app.config['PROFILE_ROUTE']:
+        data = {'status': 404, 'message': "Profiling is not enabled"}
+        resp = jsonify(data)
+        resp.status_code = data['status']
+        return resp
+    return Response(stack_sampler.folded(request.args.get('reset') == '1'), mimetype='text/plain')
 
+#Commands slower than SLOW_QUERY_MS recorded by this worker process, newest first. Instructors only.
+#Optional query parameters: route - only the commands sent by this route, e.g. /liasionTeams;
+#collscan=1 - only those explain() found scanning a whole collection (needs SLOW_QUERY_EXPLAIN); limit
+@app.route('/admin/slowQueries', methods=['GET'])
+@jwt_required()
+def get_slow_queries():
+    data = {}
+    data['status'] = 404
+    if current_instructor() is None:
+        data['message'] = "You do not have permission to perform this operation"
+    elif app.config['SLOW_QUERY_MS'] <= 0:
+        data['message'] = "The slow query log is not enabled"
+    elif 'limit' in request.args and not request.args['limit'].isdigit():
+        data['message'] = "limit must be a positive number"
+    else:
+        collscan = None
+        if 'collscan' in request.args:
+            collscan = request.args['collscan'] == '1'
+        data['queries'] = slow_queries.query(request.args.get('route'), collscan, int(request.args.get('limit', 0)))
+        data['thresholdMs'] = app.config['SLOW_QUERY_MS']
+        data['status'] = 200
+        data['message'] = "Data successfully returned"
+    resp = jsonify(data)
+    resp.status_code = data['status']
+    return resp
+
+
+
+#Build the document of a new team
+def new_team(teamParam, team_name, members, liason):
+    #Check if members is less than max team size
+    if len(members) < teamParam['maximumNumberOfStudents']:
+        status = "incomplete"
+    else:
+        status = "complete"
+    return {
+        "teamParamId" : teamParam['_id'],
+        "teamName" : team_name,
+        "dateOfCreation" : datetime.now(),
+        "status" : status,
+        "teamSize" : len(members),
+        "teamMembers": members,
+        "liason" : liason,
+        "requestedMembers" : []
+    }
+
+#Validate rows of teams to create in teamParam, checking them against each other and the database in three queries.
+#Returns (report, documents): the outcome of every row and the team documents of the valid ones, in row order
+def validate_team_rows(teamParam, rows):
+    report = []
+    names = []
+    usernames = []
+    for row in rows:
+        if isinstance(row, dict):
+            names.append(row.get('team_name'))
+            members = row.get('team_members')
+            if isinstance(members, list):
+                usernames.extend(members)
+    students = set(student['username'] for student in student_users.find({"username": {"$in": usernames}}, {"username": 1}))
+    taken_names = set(team['teamName'] for team in teams.find({"teamName": {"$in": names}}, {"teamName": 1}))
+    in_a_team = set(memberships.distinct("username", {"username": {"$in": usernames}, "teamParamId": teamParam['_id']}))
+
+    documents = []
+    for index, row in enumerate(rows):
+        outcome = OrderedDict([("row", index), ("team_name", None), ("status", "rejected")])
+        report.append(outcome)
+        if not isinstance(row, dict) or not row.get('team_name') or not isinstance(row.get('team_members'), list):
+            outcome['message'] = 'All fields must be provided!'
+            continue
+        try:
+            schema({"team_name": row['team_name']})
+            for member in row['team_members'] + ([row['liason']] if row.get('liason') else []):
+                schema({"username": member})
+        except MultipleInvalid as e:
+            outcome['message'] = e.path[0] + " is not in the correct format"
+            continue
+        team_name = row['team_name']
+        members = list(OrderedDict.fromkeys(row['team_members']))
+        liason = row.get('liason') or (members[0] if members else None)
+        if liason and liason not in members:
+            members.append(liason)
+        outcome['team_name'] = team_name
+        invalid_members = [member for member in members if member not in students]
+        members_in_a_team = [member for member in members if member in in_a_team]
+        if len(members) > teamParam['maximumNumberOfStudents']:
+            outcome['message'] = "You have selected too many members, the maximum number of members allowed is " + str(teamParam['maximumNumberOfStudents'])
+        elif len(members) < teamParam['minimumNumberOfStudents']:
+            outcome['message'] = "You did not provide enough members, the minimum number of members allowed is " + str(teamParam['minimumNumberOfStudents'])
+        elif team_name in taken_names:
+            outcome['message'] = "A team already exists with the given team name"
+        elif invalid_members:
+            outcome['message'] = invalid_members[0] + " is not a valid Student username"
+        elif members_in_a_team:
+            outcome['message'] = members_in_a_team[0] + ' is already in a team'
+        else:
+            #Later rows see the names & members of the earlier ones as taken
+            taken_names.add(team_name)
+            in_a_team.update(members)
+            outcome['status'] = "created"
+            documents.append(new_team(teamParam, team_name, members, liason))
+    return (report, documents)
+
+#Plan how to place students (documents with 'username' & 'programOfStudy') into the teams of teamParam.
+#Incomplete teams are filled first: every team below the minimum size is raised to it, then the teams are
+#filled up to the maximum. The remaining students form new teams as evenly sized as the minimum & maximum allow. With group_by_program, students of
+#the same program are placed next to each other. Linear in the number of students.
+#Returns (additions, new_teams, unassigned): the usernames to add per existing team _id, the member lists of
+#the new teams and the usernames that could not be placed
+def plan_team_allocation(teamParam, incomplete_teams, students, group_by_program=True):
+    minimum = teamParam['minimumNumberOfStudents']
+    maximum = teamParam['maximumNumberOfStudents']
+    if group_by_program:
+        programs = OrderedDict()
+        for student in students:
+            programs.setdefault(student.get('programOfStudy'), []).append(student['username'])
+        queue = [username for program in programs.values() for username in program]
+    else:
+        queue = [student['username'] for student in students]
+    position = 0
+
+    #Teams below the minimum are raised to it first, the ones closest to it first so that as many as possible
+    #get there. What is left then fills the teams up to the maximum
+    additions = OrderedDict()
+    sizes = dict((team['_id'], team['teamSize']) for team in incomplete_teams)
+    below_minimum = sorted([team for team in incomplete_teams if team['teamSize'] < minimum], key=lambda team: minimum - team['teamSize'])
+    filling = sorted(incomplete_teams, key=lambda team: team['teamSize'] >= minimum)
+    for targets, limit in ((below_minimum, minimum), (filling, maximum)):
+        for team in targets:
+            take = min(limit - sizes[team['_id']], len(queue) - position)
+            if take > 0:
+                additions.setdefault(team['_id'], []).extend(queue[position:position + take])
+                sizes[team['_id']] += take
+                position += take
+
+    new_teams = []
+    remaining = len(queue) - position
+    if remaining >= minimum:
+        count = -(-remaining // maximum) # fewest teams that fit everyone
+        if remaining // count < minimum:
+            count = remaining // minimum # too small otherwise, the surplus stays unassigned
+        size, extra = divmod(remaining, count)
+        for i in range(count):
+            take = min(size + (1 if i < extra else 0), maximum)
+            new_teams.append(queue[position:position + take])
+            position += take
+    return (additions, new_teams, queue[position:])
+
+#Write a plan from plan_team_allocation with one bulk_write & one insert_many, after claiming the memberships.
+#An existing team is only filled if its size has not changed since it was read. Returns what was written,
+#(additions, new_teams) shaped as in the plan, and the usernames of the teams that were skipped
+def apply_team_allocation(teamParam, incomplete_teams, additions, new_teams):
+    documents = []
+    for members in new_teams:
+        team_id = ObjectId()
+        document = new_team(teamParam, "Auto " + str(team_id), members, members[0])
+        document['_id'] = team_id
+        documents.append(document)
+    rejected = add_memberships(
+        [(teamParam['_id'], team_id, usernames) for team_id, usernames in additions.items()] +
+        [(teamParam['_id'], document['_id'], document['teamMembers']) for document in documents])
+    skipped = []
+    for team_id in rejected:
+        skipped.extend(additions[team_id] if team_id in additions else [])
+    skipped.extend(username for document in documents if document['_id'] in rejected for username in document['teamMembers'])
+
+    sizes = dict((team['_id'], team['teamSize']) for team in incomplete_teams)
+    filled = [team_id for team_id in additions if team_id not in rejected]
+    documents = [document for document in documents if document['_id'] not in rejected]
+    with revision(teams) as stamp:
+        requests = []
+        for team_id in filled:
+            usernames = additions[team_id]
+            update = {
+                "$push": {"teamMembers": {"$each": usernames}},
+                "$pull": {"requestedMembers": {"$in": usernames}},
+                "$inc": {"teamSize": len(usernames)},
+                "$set": {"revision": stamp}
+            }
+            if sizes[team_id] + len(usernames) >= teamParam['maximumNumberOfStudents']:
+                update['$set']['status'] = "complete"
+            requests.append(UpdateOne({"_id": team_id, "teamSize": sizes[team_id]}, update))
+        if requests and teams.bulk_write(requests, ordered=False).matched_count < len(requests):
+            #Some teams changed since they were read, release the memberships claimed for them
+            for team in teams.find({"_id": {"$in": filled}}, {"teamMembers": 1}):
+                usernames = additions[team['_id']]
+                if usernames[0] not in team['teamMembers']:
+                    remove_memberships(team['_id'], usernames)
+                    filled.remove(team['_id'])
+                    skipped.extend(usernames)
+        if documents:
+            for document in documents:
+                document['revision'] = stamp
+            teams.insert_many(documents, ordered=False)
+    written = OrderedDict((team_id, additions[team_id]) for team_id in filled)
+    return (written, [document['teamMembers'] for document in documents], skipped)
+
+#Writes to a collection clients follow (students, teamParams, teams) happen inside revision(collection), which
+#yields a new revision number to stamp on the documents written. The counter moves on as a write starts, but
+#stamps are handed out in order while writes can finish out of order. read_revisions therefore also gives
+#the settled revision, the lowest stamp that may still be in flight: 'since' deltas start from it, and
+#ETags & cached responses cover both, so they change when a write starts and again once it has settled
+@contextmanager
+def revision(collection):
+    stamp = bump_revision(collection)
+    try:
+        yield stamp
+    finally:
+        response_cache.invalidate(collection.name)
+
+#Hand out the next stamp of collection, appending its issue time to 'issued'. The last entry is always the
+#stamp just handed out, so the one before it is the previous stamp and so on. Only a prefix of entries
+#older than REVISION_SETTLE_SECONDS is ever removed, once the oldest is REVISION_PRUNE_SECONDS old
+def bump_revision(collection):
+    row = revisions.find_one_and_update({"_id": collection.name},
+                                        {"$inc": {"revision": 1}, "$push": {"issued": datetime.utcnow()}},
+                                        projection={"revision": True, "issued": {"$slice": 1}}, upsert=True,
+                                        return_document=ReturnDocument.AFTER)
+    if row['issued'][0] < datetime.utcnow() - timedelta(seconds=app.config['REVISION_PRUNE_SECONDS']):
+        prune_revision_history(collection)
+    return row['revision']
+
+#Drop the settled entries at the start of the issue history. The write is skipped if a stamp was handed
+#out meanwhile, the next bump prunes again
+def prune_revision_history(collection):
+    row = revisions.find_one({"_id": collection.name})
+    settled = datetime.utcnow() - timedelta(seconds=app.config['REVISION_SETTLE_SECONDS'])
+    drop = 0
+    while drop < len(row['issued']) - 1 and row['issued'][drop] < settled:
+        drop += 1
+    if drop:
+        revisions.update_one({"_id": collection.name, "revision": row['revision']},
+                             {"$set": {"issued": row['issued'][drop:]}})
+
+#Settled revision of a revisions document: the oldest stamp in its history issued less than
+#REVISION_SETTLE_SECONDS ago, or the next stamp to be handed out when every write has settled. Stamps no
+#longer in the history were pruned once settled. Documents stamped with it or a later one may still change
+def settled_revision(row, now):
+    recent = now - timedelta(seconds=app.config['REVISION_SETTLE_SECONDS'])
+    issued = row.get('issued', [])
+    for position, when in enumerate(issued):
+        if when > recent:
+            return row['revision'] - (len(issued) - 1 - position)
+    return row['revision'] + 1
+
+#(counter, settled revision) of each collection, in one query
+def read_revisions(collections):
+    #Already read for this request by cached_response
+    if has_request_context() and 'revisions' in g and g.revisions[0] == [collection.name for collection in collections]:
+        return g.revisions[1]
+    now = datetime.utcnow()
+    found = dict((row['_id'], (row['revision'], settled_revision(row, now)))
+                 for row in revisions.find({"_id": {"$in": [collection.name for collection in collections]}}))
+    return [found.get(collection.name, (0, 0)) for collection in collections]
+
+#Conditional GET for a response built from collections: the ETag covers their revisions, the route, its
+#arguments and, with per_user, the current user. Returns (etag, settled revisions, response) where response
+#is a 304 to return as is when the client already has this version, otherwise None
+def conditional_get(collections, per_user=False):
+    numbers = read_revisions(collections)
+    key = [request.path, sorted(request.args.items(multi=True)), numbers]
+    if per_user:
+        key.append(str(current_identity['_id']))
+    etag = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+    settled = [number[1] for number in numbers]
+    if etag in request.if_none_match:
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return (etag, settled, resp)
+    return (etag, settled, None)
+
+#Read the 'since' query parameter of a delta request into query: only documents stamped with that revision
+#or a later one. Returns False, setting data['message'], when since is not a revision number
+def parse_since_arg(query, data):
+    if 'since' in request.args:
+        try:
+            #>= rather than >, 'since' is a settled revision: a write stamped with it may not have finished when
+            #the client read it
+            query['revision'] = {"$gte": int(request.args['since'])}
+        except ValueError:
+            data['message'] = "since must be a revision number"
+            return False
+    return True
+
+#Claim the memberships of usernames in teams, given as (teamParamId, teamId, usernames) tuples.
+#The unique index refuses students already on a team of the team parameter; nothing is claimed for the teams
+#they were to join. Returns {teamId: [refused usernames]} for those teams
+def add_memberships(claims):
+    entries = []
+    for team_param_id, team_id, usernames in claims:
+        for username in OrderedDict.fromkeys(usernames):
+            entries.append({"username": username, "teamParamId": team_param_id, "teamId": team_id})
+    rejected = OrderedDict()
+    if not entries:
+        return rejected
+    try:
+        memberships.insert_many(entries, ordered=False)
+    except BulkWriteError as e:
+        for error in sorted(e.details['writeErrors'], key=lambda error: error['index']):
+            entry = entries[error['index']]
+            rejected.setdefault(entry['teamId'], []).append(entry['username'])
+        #Release what was claimed for the refused teams
+        memberships.delete_many({"$or": [
+            {"teamId": team_id, "username": {"$in": [entry['username'] for entry in entries if entry['teamId'] == team_id and entry['username'] not in usernames]}}
+            for team_id, usernames in rejected.items()]})
+    return rejected
+
+def remove_memberships(team_id, usernames):
+    memberships.delete_many({"teamId": team_id, "username": {"$in": usernames}})
+
+#Rebuild the memberships collection from the teams. Returns (memberships recorded, conflicts), a conflict
+#being a student found on more than one team of a team parameter. Usage: python server.py migrate-memberships
+def rebuild_memberships():
+    memberships.delete_many({})
+    entries = []
+    for team in teams.find({}, {"teamParamId": 1, "teamMembers": 1}):
+        for username in team['teamMembers']:
+            entries.append({"username": username, "teamParamId": team['teamParamId'], "teamId": team['_id']})
+    conflicts = 0
+    if entries:
+        try:
+            memberships.insert_many(entries, ordered=False)
+        except BulkWriteError as e:
+            conflicts = len(e.details['writeErrors'])
+    return (len(entries) - conflicts, conflicts)
+
+#Read the 'limit' & 'after' query parameters of a paged list endpoint into query.
+#Returns (valid, limit) where limit is None when no paging was asked for; sets data['message'] when invalid
+def parse_page_args(query, data, max_page_size):
+    valid = True
+    limit = None
+    if 'limit' in request.args:
+        try:
+            limit = int(request.args['limit'])
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            valid = False
+            data['message'] = "limit must be a positive number"
+        limit = min(limit, max_page_size)
+    if 'after' in request.args:
+        try:
+            query['_id'] = {"$gt": ObjectId(request.args['after'])}
+        except InvalidId:
+            valid = False
+            data['message'] = "after is not a valid id"
+    return (valid, limit)
+
+#Trim documents read with limit + 1 to the page, setting data['next'] to the cursor of the following page
+def page_of(documents, limit, data):
+    if limit and len(documents) > limit:
+        documents = documents[:limit]
+        data['next'] = documents[-1]['_id']
+    return documents
+
+#Convert the ObjectIds of a team document so it can be serialised
+def serialize_team(team):
+    team['_id'] = str(team['_id'])
+    team['teamParamId'] = str(team['teamParamId'])
+    team['dateOfCreation'] = format_date(team.get('dateOfCreation'))
+    return team
+
+#Stream data with documents as the list under key, without building the list in memory.
+#Documents are written as they come off the cursor; clients that ask for application/x-ndjson
+#get one document per line instead of the wrapping object
+def stream_json(data, key, documents):
+    ndjson = request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+    batch_size = app.config['STREAM_BATCH_SIZE']
+
+    def generate():
+        chunk = []
+        if not ndjson:
+            head = json.dumps(data)[:-1] # leave the object open for the list
+            chunk.append(head + (', ' if data else '') + json.dumps(key) + ': [')
+        first = True
+        for document in documents:
+            if ndjson:
+                chunk.append(json.dumps(document) + '\n')
+            else:
+                chunk.append(('' if first else ', ') + json.dumps(document))
+            first = False
+            if len(chunk) >= batch_size:
+                yield ''.join(chunk)
+                chunk = []
+        if not ndjson:
+            chunk.append(']}')
+        yield ''.join(chunk)
+
+    mimetype = NDJSON_MIMETYPE if ndjson else 'application/json'
+    return Response(stream_with_context(generate()), status=data['status'], mimetype=mimetype)
+
+#Return the open team parameters (deadline not passed) the user is not a member of a team in, joined with
+#their course & instructor, optionally only those closing before closing_before.
+#Costs two round trips (distinct + aggregate) regardless of how many team parameters exist
+def open_team_params_for(username, closing_before=None):
+    joined_team_params = memberships.distinct("teamParamId", {"username": username})
+    deadline = {"$gt": datetime.now()}
+    if closing_before is not None:
+        deadline["$lte"] = closing_before
+    pipeline = [
+        {"$match": {"_id": {"$nin": joined_team_params}, "closed": {"$ne": True}, "deadline": deadline}},
+        {"$lookup": {"from": courses.name, "localField": "courseId", "foreignField": "_id", "as": "course"}},
+        {"$unwind": "$course"},
+        {"$lookup": {"from": instructor_users.name, "localField": "instructorId", "foreignField": "_id", "as": "instructor"}},
+        {"$unwind": "$instructor"},
+        {"$project": {
+            "deadline": 1,
+            "minimumNumberOfStudents": 1,
+            "maximumNumberOfStudents": 1,
+            "course._id": 1,
+            "course.courseCode": 1,
+            "course.courseSection": 1,
+            "instructor._id": 1,
+            "instructor.firstName": 1,
+            "instructor.lastName": 1
+        }}
+    ]
+    return team_params.aggregate(pipeline, batchSize=AGGREGATE_BATCH_SIZE)
 
 #Validates object based on team_id and the specified db to search in
 def invalid_object(id, database):
@@ -682,6 +2370,25 @@ def validate_data_format (request, required_keys):
 
 
 if __name__ == "__main__":
-    dummyData.dummy_data()
-    app.run(port=3001)    
+    if len(sys.argv) > 1 and sys.argv[1] == 'check-indexes':
+        # Usage: python server.py check-indexes
+        for collection_name, index_name, problem in index_report():
+            print("%s.%s: %s" % (collection_name, index_name, problem))
+    elif len(sys.argv) > 1 and sys.argv[1] == 'migrate-dates':
+        # Usage: python server.py migrate-dates
+        print("%d dates converted to datetimes" % migrate_dates())
+    elif len(sys.argv) > 1 and sys.argv[1] == 'migrate-memberships':
+        # Usage: python server.py migrate-memberships
+        print("%d memberships recorded, %d conflicts" % rebuild_memberships())
+    elif len(sys.argv) > 1 and sys.argv[1] == 'migrate-users':
+        # Usage: python server.py migrate-users
+        print("%d users copied into the users directory" % migrate_user_directory())
+    elif len(sys.argv) > 1 and sys.argv[1] == 'seed':
+        # Usage: python server.py seed
+        import dummyData
+        ensure_indexes()
+        dummyData.dummy_data()
+    else:
+        #Development server only, see gunicorn.conf.py for production
+        app.run(port=3001, threaded=True)
 